@@ -8,7 +8,7 @@ setup(name='xmlwiko',
       author='Dirk Baechle',
       author_email='dl9obn@darc.de',
       url='http://bitbucket.org/dirkbaechle/xmlwiko',
-      packages=['xmlwiko'],
+      packages=['xmlwiko', 'xmlwiko.bench'],
       package_dir={'' : 'src'},
       scripts = ['xmlwiko']
      )
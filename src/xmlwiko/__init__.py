@@ -25,7 +25,90 @@ import glob
 import os.path
 import re
 import sys
+import stat
+import tempfile
+import threading
+import time
 import codecs
+import copy
+import hashlib
+import json
+import cPickle
+from xmlwiko import tree, formats
+
+__version__ = "1.7"
+
+class Highlighter :
+    """ Syntax highlighting of code with the pygments package.
+        The import of pygments is resolved only once, and the lexers
+        and formatters get cached per language. The stylesheet for the
+        highlighted code is written once, to the file styleFile.
+        The lazy setup is guarded by a lock, such that compilers in
+        several threads can share the highlighter.
+    """
+
+    def __init__(self, styleFile="style_code.css"):
+        self.styleFile = styleFile
+        self.styleWritten = False
+        self.pygments = None
+        self.formatters = {}
+        self.lock = threading.Lock()
+
+    def importPygments(self):
+        """
+        Return the tuple of pygments functions and classes we need,
+        or False if the package isn't available.
+        """
+
+        if self.pygments is None:
+            self.lock.acquire()
+            try:
+                if self.pygments is None:
+                    try :
+                        from pygments import highlight
+                        from pygments.lexers import get_lexer_by_name
+                        from pygments.formatters import HtmlFormatter
+                        self.pygments = (highlight, get_lexer_by_name, HtmlFormatter)
+                    except:
+                        self.pygments = False
+            finally:
+                self.lock.release()
+        return self.pygments
+
+    def highlight(self, txt, language):
+        """
+        Format the given code text for the specified language. If
+        pygments or the language isn't available, the text is returned as is.
+        """
+
+        if language.strip() == "":
+            return txt
+        pygments = self.importPygments()
+        if not pygments:
+            return txt
+        highlight, get_lexer_by_name, HtmlFormatter = pygments
+        if not self.styleWritten or language not in self.formatters:
+            self.lock.acquire()
+            try:
+                if not self.styleWritten:
+                    file(self.styleFile,'w').write(HtmlFormatter().get_style_defs('.code'))
+                    self.styleWritten = True
+                if language not in self.formatters:
+                    try:
+                        lexer = get_lexer_by_name(language, stripnl=True)
+                        formatter = HtmlFormatter(linenos=False, cssclass="code")
+                        self.formatters[language] = (lexer, formatter)
+                    except:
+                        self.formatters[language] = None
+            finally:
+                self.lock.release()
+        if self.formatters[language] is None:
+            return txt
+        lexer, formatter = self.formatters[language]
+        return highlight(txt, lexer, formatter)
+
+# Shared highlighter for all compilers
+highlighter = Highlighter()
 
 def processVerbatim(txt, language):
     """
@@ -34,23 +117,7 @@ def processVerbatim(txt, language):
     specified language. Else, return the text/code as is.
     """
     
-    if language.strip() == "":
-        return txt
-    else:    
-        try :
-            from pygments import highlight
-            from pygments.lexers import get_lexer_by_name
-            from pygments.formatters import HtmlFormatter
-        except:
-            return txt
-        file("style_code.css",'w').write(HtmlFormatter().get_style_defs('.code'))
-
-        try:
-            lexer = get_lexer_by_name(language, stripall=True)
-            formatter = HtmlFormatter(linenos=False, cssclass="code")
-        except:
-            return txt
-        return highlight(txt, lexer, formatter)
+    return highlighter.highlight(txt, language)
 
 # Regular expressions
 header = re.compile(r"^==(\+|-?[0-9]+|-*)\s*([^=]+)\s*=*\s*(.*)$")
@@ -69,18 +136,245 @@ anchor = re.compile(r"@@([^@]*)@@")
 img = re.compile(r"<<([^>]*)>>")
 filter = re.compile(r"\*\*([^\s]*)\s+([^\*]*)\*\*")
 
+# Inline markups in the order of their precedence, as pairs of
+# markup name and regular expression
+inlineMarkups = [('img', img),
+                 ('urls', urls),
+                 ('links', links),
+                 ('url', url),
+                 ('xref', xref),
+                 ('link', link),
+                 ('em', em),
+                 ('strong', strong),
+                 ('quote', quote),
+                 ('code', code),
+                 ('quotedcode', quotedcode),
+                 ('anchor', anchor)]
+# Inline markups that are output with the inlineTags of a compiler
+inlineTagKeys = ['em', 'strong', 'quote', 'code', 'quotedcode', 'anchor']
+# Keys into the dictTags of a compiler, for the different link markups
+linkTagKeys = formats.linkTagKeys
+
+# Cache of combined regular expressions, see inlineScanner()
+_inlineScanners = {}
+
+def inlineScanner(first, last, skip=()):
+    """
+    Return a single regular expression that matches all the inline
+    markups inlineMarkups[first:last], except the positions in skip,
+    together with a dict that maps the index of each group to the
+    markup it belongs to, as a pair of the markup's position in
+    inlineMarkups and its first group.
+    Note: The patterns are joined without enclosing groups, such that
+    the regexp engine can still skip ahead to the first char of a markup.
+    """
+
+    key = (first, last, skip)
+    if key not in _inlineScanners:
+        alternatives = []
+        markupIndex = {}
+        gidx = 1
+        for mi in range(first, last):
+            if mi in skip:
+                continue
+            rex = inlineMarkups[mi][1]
+            alternatives.append(rex.pattern)
+            for g in range(gidx, gidx+rex.groups):
+                markupIndex[g] = (mi, gidx)
+            gidx += rex.groups
+        _inlineScanners[key] = (re.compile("|".join(alternatives)), markupIndex)
+    return _inlineScanners[key]
+
+# Inline markups whose regexes scan ahead over long runs of text, looking
+# for their end: opening and closing string, whether the text in between
+# starts with a key that can't contain blanks (like for links), and whether
+# a blank has to follow the key
+guardedMarkups = {'img' : ('<<', '>>', False, False),
+                  'urls' : ('[[', ']]', True, False),
+                  'links' : ('((', '))', True, False),
+                  'url' : ('[[', ']]', True, True),
+                  'xref' : ('&&', '&&', True, True),
+                  'link' : ('((', '))', True, True),
+                  'filter' : ('**', '**', True, True)}
+# Texts up to this length get scanned without MarkupGuards
+guardLength = 256
+blank = re.compile(r"\s")
+# The last blank of a text
+lastBlank = re.compile(r"\s\S*\Z")
+
+def inlineMatch(match, markupIndex):
+    """
+    Return the tuple (mi, groups, start, end) for the match of an
+    inlineScanner() with the given markupIndex, where mi is the position
+    of the found markup in inlineMarkups. Returns None for no match.
+    """
+
+    if match is None:
+        return None
+    mi, gidx = markupIndex[match.lastindex]
+    groups = [match.group(g) for g in range(gidx, gidx+inlineMarkups[mi][1].groups)]
+    return mi, groups, match.start(), match.end()
+
+class MarkupGuard :
+    """ Finds the matches of a markup of guardedMarkups in a long text.
+        For a long line with many unclosed markers, its regex would scan
+        to the end again from each marker, taking quadratic time. So where
+        a marker can't start a match, the guard remembers the char at
+        which the scan failed, and skips all the following markers that
+        would fail at the same char. Each part of the text gets scanned
+        only once.
+    """
+
+    def __init__(self, text, markup, rex):
+        self.text = text
+        self.rex = rex
+        self.opener, self.closer, self.hasKey, self.needsBlank = guardedMarkups[markup]
+        # Position of the next match, and of the first opener that
+        # isn't checked yet (-1, if no opener can match anymore)
+        self.start = -1
+        self.checked = 0
+        # Position of the next closer, for a key without blank
+        self.close = -1
+
+    def failsAt(self, start):
+        """
+        Return -1, if the markup matches at the opener at start.
+        Else return the position up to which no opener can match.
+        """
+
+        text = self.text
+        after = start + len(self.opener)
+        if not self.hasKey:
+            # The text in between ends at the first char of the closer
+            end = text.find(self.closer[0], after)
+            if end < 0:
+                return len(text)
+            if text.startswith(self.closer, end):
+                return -1
+            return end
+        match = blank.search(text, after)
+        if match:
+            keyEnd = match.start()
+        else:
+            keyEnd = len(text)
+        if not self.needsBlank:
+            # The closer has to follow before the next blank
+            if self.close < after:
+                self.close = text.find(self.closer, after)
+                if self.close < 0:
+                    return len(text)
+            if self.close < keyEnd:
+                return -1
+            return keyEnd
+        if not match:
+            return len(text)
+        # The text behind the blank ends at the first char of the closer
+        end = text.find(self.closer[0], keyEnd)
+        if end < 0:
+            return len(text)
+        if text.startswith(self.closer, end):
+            return -1
+        # So does the text of each opener, whose key ends before end
+        return lastBlank.search(text, keyEnd, end).start() - len(self.opener) + 1
+
+    def check(self, pos):
+        """
+        Return the position of the next match at or behind pos,
+        or -1 if the markup can't match behind pos.
+        """
+
+        if self.start >= pos or self.checked < 0:
+            return self.start
+        start = max(pos, self.checked)
+        while True:
+            start = self.text.find(self.opener, start)
+            if start < 0:
+                break
+            fail = self.failsAt(start)
+            if fail < 0:
+                break
+            start = fail
+        self.start = start
+        if start < 0:
+            self.checked = -1
+        else:
+            self.checked = start + 1
+        return start
+
+    def search(self, pos):
+        """
+        Return the next match at or behind pos, or None.
+        """
+
+        start = self.check(pos)
+        if start < 0:
+            return None
+        return self.rex.match(self.text, start)
+
+class MarkupGuards :
+    """ Finds the inline markups inlineMarkups[first:last] in a long text,
+        the guarded ones with a MarkupGuard each, and all the others with
+        a single inlineScanner().
+    """
+
+    def __init__(self, text, first, last):
+        self.text = text
+        self.guards = []
+        for mi in range(first, last):
+            markup, rex = inlineMarkups[mi]
+            if markup in guardedMarkups:
+                self.guards.append((mi, MarkupGuard(text, markup, rex)))
+        self.scanner = None
+        if len(self.guards) < last - first:
+            self.scanner, self.markupIndex = inlineScanner(first, last,
+                                                           tuple([g[0] for g in self.guards]))
+        # Next match of the scanner
+        self.match = None
+        self.searched = False
+
+    def search(self, pos):
+        """
+        Return the next markup at or behind pos like inlineMatch(),
+        or None if no markup matches anymore.
+        """
+
+        if self.scanner is not None and (not self.searched or
+                                         (self.match is not None and self.match.start() < pos)):
+            self.match = self.scanner.search(self.text, pos)
+            self.searched = True
+        mi = start = -1
+        for gmi, guard in self.guards:
+            gstart = guard.check(pos)
+            if gstart >= 0 and (start < 0 or gstart < start):
+                mi, start = gmi, gstart
+        # The guarded markups come first in inlineMarkups, so they
+        # take precedence for a match at the same position
+        if self.match is not None and (start < 0 or self.match.start() < start):
+            return inlineMatch(self.match, self.markupIndex)
+        if start < 0:
+            return None
+        match = inlineMarkups[mi][1].match(self.text, start)
+        return mi, list(match.groups()), start, match.end()
+
 li  = re.compile(r"^({*)([*#~]+)(.*)")
 var = re.compile(r"^@([^:]*): (.*)")
 
 env = re.compile(r"^({*)([a-zA-Z]+):(-*|-?[0-9]+)\s*(.*)$")
 closeenv = re.compile(r"^}}\s*$")
 
+# First characters of the lines that the env and li regexes can match
+envStartChars = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ")
+listStartChars = frozenset("*#~")
+
 #
 # Definition of output tags for the different formats
 #
 # Meaning of fields from left to right is: 
 #   tagstart, tagend, wrap_in_para, add_newline_on_close
 #
+# The tables of each format get compiled once into an OutputFormat
+# (see xmlwiko.formats), that the compilers work with.
+#
 
 # Forrest output tags
 envTagsForrest = {
@@ -125,6 +419,8 @@ dictTagsForrest = {'ulink' : '<a href="%(url)s"%(atts)s>%(linktext)s</a>',
                   }
 filterForrest = {'forrest' : '%(content)s'
                 }
+formatForrest = formats.OutputFormat('forrest', envTagsForrest, inlineTagsForrest,
+                                     dictTagsForrest, filterForrest)
 
 # Default template for a Forrest XML file
 defaultSkeletonForrest = u"""<?xml version="1.0" encoding="utf-8"?>
@@ -182,6 +478,8 @@ dictTagsDocbook = {'ulink' : '<ulink url="%(url)s"%(atts)s>%(linktext)s</ulink>'
                   }
 filterDocbook = {'docbook' : '%(content)s'
                 }
+formatDocbook = formats.OutputFormat('db', envTagsDocbook, inlineTagsDocbook,
+                                     dictTagsDocbook, filterDocbook)
 
 # Default template for a Docbook XML file
 defaultSkeletonDocbook = u"""<?xml version="1.0" encoding="UTF-8"?>
@@ -242,6 +540,8 @@ dictTagsMoin = {'ulink' : '[[%(url)s|%(linktext)s]]',
                }
 filterMoin = {'moin' : '%(content)s'
              }
+formatMoin = formats.OutputFormat('moin', envTagsMoin, inlineTagsMoin,
+                                  dictTagsMoin, filterMoin)
 
 # Default template for a MoinMoin Wiki file
 defaultSkeletonMoin = u"""%(title)s
@@ -295,6 +595,8 @@ dictTagsRest = {'ulink' : '`%(linktext)s <%(url)s/>`_',
                }
 filterRest = {'rest' : '%(content)s'
              }
+formatRest = formats.OutputFormat('rest', envTagsRest, inlineTagsRest,
+                                  dictTagsRest, filterRest)
 
 # Default template for a reStructuredText file
 defaultSkeletonRest = u"""####################################
@@ -313,17 +615,54 @@ def stripUtfMarker(content) :
     of the input file/content.
     """
     
-    import codecs
-    return content.replace( unicode(codecs.BOM_UTF8,"utf8"), "")
+    if content.startswith(u"\ufeff"):
+        return content[1:]
+    return content
+
+# Sources of this size (in bytes) or larger get memory-mapped for reading
+mmapThreshold = 16*1024*1024
 
 def readUtf8(filename, quiet=False) :
     """
     Read the contents of the given file filename in UTF8 encoding.
+    An optional UTF8 marker at the start gets stripped. Large files
+    are decoded straight from a memory map, without reading them
+    into a string first.
     """
     
     if not quiet:
         print "Reading",filename
-    return stripUtfMarker(codecs.open(filename,'r','utf8').read())
+    f = open(filename, 'rb')
+    try:
+        if os.fstat(f.fileno()).st_size >= mmapThreshold:
+            import mmap
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            data = f.read()
+        try:
+            start = 0
+            if data[:3] == codecs.BOM_UTF8:
+                start = 3
+            return codecs.utf_8_decode(buffer(data, start), 'strict', True)[0]
+        finally:
+            if not isinstance(data, str):
+                data.close()
+    finally:
+        f.close()
+
+def iterUtf8Lines(f) :
+    """
+    Yield the lines of the opened file f in UTF8 encoding, without
+    line endings. An optional UTF8 marker at the start gets stripped.
+    """
+    
+    first = True
+    for line in codecs.getreader('utf8')(f):
+        line = line.splitlines()[0]
+        if first:
+            line = line.lstrip(unicode(codecs.BOM_UTF8,"utf8"))
+            first = False
+        yield line
 
 def loadOrDefault(filename, defaultContent, quiet=False) :
     """
@@ -334,17 +673,363 @@ def loadOrDefault(filename, defaultContent, quiet=False) :
     try: return readUtf8(filename, quiet)
     except: return defaultContent
 
+# Folders that makeDirs() created or found already
+_knownDirs = set()
+
+def makeDirs(path) :
+    """
+    Create the folder path and all its parents, unless they exist.
+    Folders that were seen once don't get checked again.
+    """
+
+    if not path or path in _knownDirs:
+        return
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            # Created by a parallel build in the meantime?
+            if not os.path.isdir(path):
+                raise
+    _knownDirs.add(path)
+
+# Mask for the permissions of new files, see newFileMode()
+_umask = None
+
+def newFileMode(filename) :
+    """
+    Return the permissions for writing the file filename: those
+    of the existing file, or the default ones for a new file.
+    """
+
+    global _umask
+    try:
+        return stat.S_IMODE(os.stat(filename).st_mode)
+    except OSError:
+        if _umask is None:
+            _umask = os.umask(0)
+            os.umask(_umask)
+        return 0666 & ~_umask
+
 def writeUtf8(filename, content) :
     """
     Save the content to a file with the given filename in UTF8 encoding.
+    The content goes to a temporary file in the same folder first,
+    which then replaces the file. So the file never holds only a part
+    of the content, even when the build gets interrupted.
     """
     
-    import codecs, os
-    path = filename.split("/")[:-1]
-    for i in range(len(path)) :
-        try : os.mkdir("/".join(path[:i+1]))
-        except: pass
-    codecs.open(filename, "w",'utf8').write(content)
+    writeChunks(filename, [content])
+
+def sameFiles(filename, other) :
+    """
+    Return True if the files filename and other hold the same bytes.
+    """
+
+    try:
+        if os.stat(filename).st_size != os.stat(other).st_size:
+            return False
+        f = open(filename, 'rb')
+        try:
+            g = open(other, 'rb')
+            try:
+                while True:
+                    block = f.read(65536)
+                    if block != g.read(65536):
+                        return False
+                    if not block:
+                        return True
+            finally:
+                g.close()
+        finally:
+            f.close()
+    except (OSError, IOError):
+        return False
+
+def copyChunks(filename) :
+    """
+    Yield the content of the file filename in blocks.
+    """
+
+    f = open(filename, 'rb')
+    try:
+        while True:
+            block = f.read(65536)
+            if not block:
+                break
+            yield block
+    finally:
+        f.close()
+
+def writeChunks(filename, chunks, onlyIfChanged=False) :
+    """
+    Save the iterable of text chunks to a file with the given filename
+    in UTF8 encoding, like writeUtf8(), but one chunk after the other.
+    So the complete content is never held in memory. With onlyIfChanged,
+    the new file is compared with the old one after writing, and
+    dropped if they're the same.
+    Returns True if the file was written.
+    """
+
+    path = os.path.dirname(filename)
+    makeDirs(path)
+    fd, tmp = tempfile.mkstemp(prefix="." + os.path.basename(filename) + ".",
+                               dir=path or ".")
+    try:
+        f = os.fdopen(fd, 'wb')
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, unicode):
+                    chunk = chunk.encode('utf8')
+                f.write(chunk)
+        finally:
+            f.close()
+        if onlyIfChanged and sameFiles(tmp, filename):
+            os.remove(tmp)
+            return False
+        os.chmod(tmp, newFileMode(filename))
+        if os.name == 'nt' and os.path.exists(filename):
+            # No atomic replace on Windows
+            os.remove(filename)
+        os.rename(tmp, filename)
+    except:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return True
+
+class BuildCache :
+    """ Persistent manifest of the outputs created by a directory build.
+        For each target file it stores a key, derived from the source
+        content, the skeleton, the selected compiler and the xmlwiko
+        version. Targets whose key didn't change can then be skipped.
+        The files that each source includes are recorded as well, since
+        they change its output too.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}
+        # Files included by each source, see depend()
+        self.includes = {}
+        self.seen = {}
+        self.seenIncludes = {}
+        try:
+            manifest = json.load(open(filename, 'r'))
+            self.entries = manifest['targets']
+            self.includes = manifest['includes']
+        except:
+            pass
+
+    def key(self, digest, skeleton, compiler, includes=()):
+        """
+        Return the build key for a source file with the given digest
+        (see fileDigest()), skeleton text and compiler name. It covers
+        the list includes as well, with a (filename, digest) tuple for
+        each file that the source includes.
+        """
+
+        h = hashlib.sha1()
+        h.update(digest or "-")
+        h.update(skeleton.encode('utf8'))
+        h.update(compiler)
+        h.update(__version__)
+        for filename, fdigest in includes:
+            h.update(filename.encode('utf8'))
+            h.update(fdigest or "-")
+        return h.hexdigest()
+
+    def includeDigests(self, source):
+        """
+        Return a (filename, digest) tuple with the current digest of
+        each file that the file source included at its last build.
+        """
+
+        return [(filename, fileDigest(filename))
+                for filename in self.includes.get(source, [])]
+
+    def depend(self, source, includes):
+        """
+        Remember the list of files that the file source includes,
+        directly or indirectly. They're part of its build keys
+        from now on, such that changing one of them rebuilds source.
+        """
+
+        if includes:
+            self.includes[source] = self.seenIncludes[source] = list(includes)
+        else:
+            self.includes.pop(source, None)
+            self.seenIncludes.pop(source, None)
+
+    def isCurrent(self, target, key):
+        """
+        Return True if the target file exists and was built
+        with the given key.
+        """
+
+        return (self.entries.get(target) == key and
+                os.path.exists(target))
+
+    def update(self, target, key):
+        """
+        Remember the key for the given target, it gets saved
+        with the next call to save().
+        """
+
+        self.seen[target] = key
+        self.entries[target] = key
+
+    def save(self):
+        """
+        Write the manifest to disk. Only the targets that were
+        seen during the current build are kept.
+        """
+
+        writeChunks(self.filename,
+                    [json.dumps({'targets' : self.seen, 'includes' : self.seenIncludes},
+                                indent=0, sort_keys=True)])
+
+class LinkIndex :
+    """ Index of the section and anchor IDs of all files in a directory
+        build, and of the IDs that their xrefs and links refer to.
+        The index gets saved to disk, such that only the entries of the
+        files that get compiled again have to be updated.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}
+        self.seen = {}
+        try:
+            self.entries = json.load(open(filename, 'r'))
+        except:
+            pass
+
+    def has(self, source):
+        """
+        Return True if the index holds an entry for the file source.
+        """
+
+        return source in self.entries
+
+    def keep(self, source):
+        """
+        Keep the entry for the file source, that didn't change.
+        """
+
+        self.seen[source] = self.entries[source]
+
+    def update(self, source, targets, refs):
+        """
+        Set the IDs that the file source defines (targets) and
+        refers to (refs).
+        """
+
+        self.entries[source] = self.seen[source] = {'targets' : list(targets),
+                                                    'refs' : list(refs)}
+
+    def unresolved(self):
+        """
+        Return the sorted list of (source, ids) tuples, for the files
+        whose xrefs and links refer to IDs that no file defines.
+        """
+
+        targets = set()
+        for entry in self.seen.values():
+            targets.update(entry['targets'])
+        result = []
+        for source in sorted(self.seen):
+            missing = [r for r in self.seen[source]['refs'] if r not in targets]
+            if missing:
+                result.append((source, missing))
+        return result
+
+    def save(self):
+        """
+        Write the index to disk. Only the files that were seen
+        during the current build are kept.
+        """
+
+        writeChunks(self.filename, [json.dumps(self.seen, indent=0, sort_keys=True)])
+
+def fileDigest(filename):
+    """
+    Return the SHA1 hash of the content of the file filename,
+    or None if it can't be read.
+    """
+
+    try:
+        f = open(filename, 'rb')
+        try:
+            return hashlib.sha1(f.read()).hexdigest()
+        finally:
+            f.close()
+    except IOError:
+        return None
+
+class IncludeCache :
+    """ Cache for the compiled output of included Wiki files, see
+        WikiCompiler.includeFile(). An entry is stored under a key derived
+        from the file's name, the output format and the section indent of
+        the include. It holds the tuple (digest, output, targets, refs,
+        includes), with the digest of the file, the link IDs of the output
+        and a (filename, digest) tuple for each file that got included in
+        turn. The entry is only valid while the digests of the file and of
+        those files don't change, else it gets replaced by the next put().
+        So each include keeps a single entry, and the folder doesn't
+        grow with every edit.
+        With a folder, the entries also get saved to disk, such that the
+        processes of a parallel build and later builds can share them.
+    """
+
+    def __init__(self, folder=None):
+        self.folder = folder
+        self.entries = {}
+
+    def get(self, key, digest):
+        """
+        Return the valid entry for the given key, if it was
+        compiled from a file with the given digest. Else None.
+        """
+
+        entry = self.entries.get(key)
+        if entry is None and self.folder:
+            try:
+                f = open(os.path.join(self.folder, key), 'rb')
+                try:
+                    entry = cPickle.load(f)
+                finally:
+                    f.close()
+            except Exception:
+                return None
+        if entry is None or entry[0] != digest:
+            return None
+        for filename, fdigest in entry[4]:
+            if fileDigest(filename) != fdigest:
+                return None
+        self.entries[key] = entry
+        return entry
+
+    def put(self, key, entry):
+        """
+        Store the entry under the given key.
+        """
+
+        self.entries[key] = entry
+        if self.folder:
+            writeChunks(os.path.join(self.folder, key),
+                        [cPickle.dumps(entry, cPickle.HIGHEST_PROTOCOL)])
+
+# The IncludeCache of all compilers
+includeCache = IncludeCache()
+
+def includePath(folder, envMatch):
+    """
+    Return the path of the file, that the 'Include:' line of the given
+    env match names, relative to the folder of the including file.
+    """
+
+    return os.path.normpath(os.path.join(folder, envMatch.group(4).strip()))
 
 def tos(seq):
     """
@@ -372,20 +1057,163 @@ PM_LIST = 5
 
 list_items = ['#','*','~','olItem','ulItem','dtItem','ddItem']
 
+class Profile :
+    """ Cumulative time and number of calls for the single stages of
+        a compilation, like the parsing of lines or inline markups.
+        The time of a stage doesn't include the time of the stages
+        that it calls in turn.
+    """
+
+    def __init__(self):
+        # [seconds, calls] for each stage
+        self.stages = {}
+        # Time spent in called stages, for each running stage
+        self.running = []
+
+    def timed(self, stage, func):
+        """
+        Return a wrapper for the function func, that adds the time and
+        number of its calls to the given stage.
+        """
+
+        stages = self.stages
+        running = self.running
+        def wrapper(*args, **kwargs):
+            running.append(0.0)
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.time() - start
+                inner = running.pop()
+                if running:
+                    running[-1] += elapsed
+                entry = stages.setdefault(stage, [0.0, 0])
+                entry[0] += elapsed - inner
+                entry[1] += 1
+        return wrapper
+
+    def report(self):
+        """
+        Return a breakdown of the time for each stage as text,
+        starting with the slowest one.
+        """
+
+        total = sum([t for t, c in self.stages.values()]) or 1.0
+        lines = ["%-10s %10s %8s %7s" % ("stage", "seconds", "calls", "share")]
+        for t, c, stage in sorted([(t, c, s) for s, (t, c) in self.stages.items()],
+                                  reverse=True):
+            lines.append("%-10s %10.4f %8d %6.1f%%" % (stage, t, c, t * 100.0 / total))
+        return "\n".join(lines)
+
+# Methods of a WikiCompiler that get timed as single stages, see
+# WikiCompiler.enableProfiling()
+profiledStages = [('lines', 'processLine'),
+                  ('lists', 'processList'),
+                  ('inline', 'inlineReplace'),
+                  ('highlight', 'writeCode')]
+
+# Attributes of a WikiCompiler that hold the state of the parsing
+# machine between two lines, see WikiCompiler.parserState()
+parserStateAttributes = ['itemLevel', 'closing', 'vars', 'parseMode', 'codeType',
+                         'codeLines', 'lastBlock', 'sectionIndent', 'inSection',
+                         'envStack', 'modeStack', 'lastListItem']
+
 class WikiCompiler :
     """ The base class for compiling Wiki files to XML output.
+        The compiler itself only holds the tables of its output format.
+        Each document gets compiled in a context of its own (see
+        newContext()), such that one compiler can be shared by
+        several threads.
     """
-    
+
+    # The precompiled OutputFormat, if none is given to the constructor
+    defaultFormat = None
+    # The Profile of the compiler, while profiling is enabled
+    profile = None
+    # The context of the last document compiled by process() or render()
+    lastContext = None
+    # Included files are looked up relative to this folder, see setSource()
+    sourceDir = ''
+    # Absolute paths of the files that are currently being included
+    includeStack = ()
+    # Indent level of the top sections, in the output of an included file
+    sectionBase = 0
+    # New names for section and anchor IDs (and the refs to them), or None
+    idMap = None
+
+    def __init__(self, outputFormat=None):
+        self.setFormat(outputFormat or self.defaultFormat)
+
+    def setFormat(self, outputFormat):
+        """
+        Compile to the given OutputFormat. Its tag tables are also
+        available as envTags, inlineTags, dictTags and filters.
+        """
+
+        self.outputFormat = outputFormat
+        self.envTags = outputFormat.envTags
+        self.inlineTags = outputFormat.inlineTags
+        self.dictTags = outputFormat.dictTags
+        self.filters = outputFormat.filters
+
+    def newContext(self):
+        """
+        Return a new context for compiling a single document: a shallow copy
+        of this compiler, that shares its format tables (which are never
+        modified) but holds the state of the parsing machine for itself.
+        """
+
+        ctx = copy.copy(self)
+        ctx.__dict__.pop('lastContext', None)
+        if self.profile is not None:
+            # Bind the timing wrappers to the context
+            ctx.enableProfiling(self.profile)
+        return ctx
+
+    def setSource(self, source):
+        """
+        Set the name of the Wiki file, that gets compiled in this context.
+        The files that it includes are relative to its folder.
+        """
+
+        self.sourceDir = os.path.dirname(source)
+        self.includeStack = (os.path.abspath(source),)
+
+    def enableProfiling(self, profile=None):
+        """
+        Start to collect the time and number of calls for the stages of
+        the compilation (see profiledStages) in the Profile profile, or in
+        a new one. Returns the Profile.
+        Without profiling the compiler runs at full speed, since the
+        timing wrappers only get installed on this instance.
+        """
+
+        if profile is None:
+            profile = Profile()
+        self.profile = profile
+        for stage, name in profiledStages:
+            method = getattr(self.__class__, name).__get__(self, self.__class__)
+            setattr(self, name, profile.timed(stage, method))
+        return profile
+
+    def disableProfiling(self):
+        """
+        Stop profiling, and remove the timing wrappers.
+        """
+
+        for stage, name in profiledStages:
+            self.__dict__.pop(name, None)
+        self.profile = None
+
     def closeAllOpenedBlocks(self):
         """
         Purge all opened blocks or XML tags.
         """
         
+        envs = self.outputFormat.envs
         while len(self.openBlocks):
-            tos = self.openBlocks.pop()
-            self.result += "%s" % self.envTags[tos][1]
-            if self.envTags[tos][3]:
-                self.result += "\n"
+            self.result.append(envs[self.openBlocks.pop()].close)
             
     def closeOpenedBlocks(self, tag, num=1):
         """
@@ -393,12 +1221,11 @@ class WikiCompiler :
         of the given tag.
         """
         
+        envs = self.outputFormat.envs
         cnt = 0
         while len(self.openBlocks):
             tos = self.openBlocks.pop()
-            self.result += "%s" % self.envTags[tos][1]
-            if self.envTags[tos][3]:
-                self.result += "\n"
+            self.result.append(envs[tos].close)
             
             if tos == tag:
                 cnt += 1
@@ -413,11 +1240,129 @@ class WikiCompiler :
         """
          
         if len(kwargs):
-            self.result += "%s" % (self.envTags[tag][0] % kwargs)
+            self.result.append(self.outputFormat.envs[tag].start % kwargs)
         else:
-            self.result += "%s" % self.envTags[tag][0]
+            self.result.append(self.outputFormat.envs[tag].start)
         self.openBlocks.append(tag)
-         
+
+    def openBlock(self, tag, **kwargs):
+        """
+        Open the given environment tag like openEnv(), but also
+        open a paragraph within, if the output format wraps the
+        text of this environment in paras.
+        """
+
+        self.openEnv(tag, **kwargs)
+        if self.outputFormat.envs[tag].wrapInPara:
+            # Wrap text in para
+            self.openEnv('Para')
+
+    def openFigure(self, tag, href, atts=None):
+        """
+        Open the Figure or Image environment tag for the image href.
+        The optional atts get filtered, else the href is also
+        used as alt text.
+        """
+
+        if atts is None:
+            figatts = ' alt="'+href+'"'
+        else:
+            figatts = ' '+self.applyFilters(atts)
+        self.openBlock(tag, fref=href, atts=figatts)
+
+    def openSection(self, sectionTitle, sectionId, sectionIndent):
+        """
+        Open a new section with the given title and id, at the
+        indent level sectionIndent.
+        """
+
+        fmt = self.outputFormat
+        if self.idMap:
+            sectionId = self.idMap.get(sectionId, sectionId)
+        self.openBlocks.append('Section')
+        self.linkTargets.append(sectionId)
+        if fmt.titleChars:
+            # Handling of section titles that get constructed by prepending
+            # a number of chars to the title, representing the current indentation
+            # depth, e.g. MoinMoin format
+            newtitle = fmt.titleChars[0]*(sectionIndent+1)
+            newtitle += " %s " % sectionTitle
+            newtitle += fmt.titleChars[1]*(sectionIndent+1)
+            sectionTitle = newtitle
+        elif fmt.underlineChars:
+            # Handling reST style section titles, where the char for the
+            # underline changes with the level of indent
+            linechars = fmt.underlineChars
+            tchar = linechars[sectionIndent % len(linechars)]
+            sectionTitle += "\n"+len(sectionTitle)*tchar
+        text = fmt.section.fill(sectionTitle, sectionId) + "\n"
+        self.result.append(self.inlineReplace(text))
+
+    def includeFile(self, filename, sectionIndent):
+        """
+        Insert the output for the Wiki file filename, with its top
+        sections at the indent level sectionIndent. All opened blocks
+        within the current section get closed first. The output of
+        the file is compiled in a context of its own, and taken from
+        the includeCache while the file doesn't change.
+        """
+
+        envs = self.outputFormat.envs
+        while len(self.openBlocks) and tos(self.openBlocks) != 'Section':
+            self.result.append(envs[self.openBlocks.pop()].close)
+
+        filename = os.path.abspath(filename)
+        if filename in self.includeStack:
+            raise ValueError("recursive include of %s" % filename)
+        try:
+            data = open(filename, 'rb').read()
+        except IOError, e:
+            raise ValueError("can't read the included file %s (%s)" % (filename, e.strerror))
+        digest = hashlib.sha1(data).hexdigest()
+        key = hashlib.sha1("\0".join([filename.encode('utf8'),
+                                      self.outputFormat.name, self.__class__.__name__,
+                                      str(sectionIndent), __version__,
+                                      repr(sorted((self.idMap or {}).items()))])).hexdigest()
+        entry = includeCache.get(key, digest)
+        if entry is None:
+            ctx = self.newContext()
+            ctx.sourceDir = os.path.dirname(filename)
+            ctx.includeStack = self.includeStack + (filename,)
+            ctx.sectionBase = sectionIndent
+            content = stripUtfMarker(data.decode('utf8'))
+            output = "".join(ctx.processLines(content.splitlines()))
+            entry = (digest, output, ctx.linkTargets, ctx.linkRefs, ctx.includes)
+            includeCache.put(key, entry)
+        digest, output, targets, refs, includes = entry
+        self.result.append(output)
+        self.linkTargets.extend(targets)
+        self.linkRefs.extend(refs)
+        self.includes.append((filename, digest))
+        self.includes.extend(includes)
+
+    def writeText(self, text):
+        """
+        Output a normal line of text, after replacing its
+        inline expressions.
+        """
+
+        self.result.append("%s\n" % self.inlineReplace(text))
+
+    def writeCode(self, lines, codeType):
+        """
+        Output the lines of a Code environment, with the blank marker
+        replaced and special chars escaped. Empty lines are given
+        as None. The whole block gets highlighted for the
+        language codeType.
+        """
+
+        code = []
+        for l in lines:
+            if l is None:
+                code.append("\n")
+            else:
+                code.append("%s\n" % self.escapeCodeText(self.replaceBlanks(l)))
+        self.result.append(processVerbatim("".join(code), codeType))
         
     def closeEnv(self, tag, **kwargs):
         """
@@ -427,9 +1372,9 @@ class WikiCompiler :
         """
         
         if len(kwargs):
-            self.result += "%s\n" % (self.envTags[tag][1] % kwargs)
+            self.result.append("%s\n" % (self.outputFormat.envs[tag].end % kwargs))
         else:
-            self.result += "%s\n" % self.envTags[tag][1]
+            self.result.append(self.outputFormat.envs[tag].closeLine)
         if tos(self.openBlocks) == tag:
             self.openBlocks.pop()
         else:
@@ -452,6 +1397,7 @@ class WikiCompiler :
         is an opened one on the stack at all.
         """
         
+        self.flushCode()
         if len(self.envStack) > 0:
             cenv = self.envStack.pop()
             self.closeOpenedBlocks(cenv, 1)
@@ -460,15 +1406,16 @@ class WikiCompiler :
             else:
                 self.parseMode = PM_VOID
 
-    def process(self, content) :
+    def initDocument(self):
         """
-        Does the main work, by parsing the content as read from
-        the current input file.
+        Reset the state of the parsing machine, before a new
+        document gets processed.
         """
         
         self.itemLevel = ""
         self.closing=""
-        self.result=""
+        # Output chunks, not yet passed on to the caller
+        self.result=[]
         
         self.vars = {
             'title': '',
@@ -478,60 +1425,192 @@ class WikiCompiler :
         self.openBlocks = []
         self.parseMode = 0
         self.codeType = ""
+        self.codeLines = []
         self.lastBlock = None
         self.sectionIndent = 0
+        self.inSection = False
         # Collect list envs
         self.envStack = [] # keeps track of the opened envs
         self.modeStack = [] # keeps track of the parsing modes in the opened envs
         self.lastListItem = ""
+        # IDs of the sections and anchors, and the IDs referenced
+        # by xrefs and links, see linkInfo()
+        self.linkTargets = []
+        self.linkRefs = []
+        # (filename, digest) of the included files, see dependencies()
+        self.includes = []
+
+    def linkInfo(self):
+        """
+        Return the tuple (targets, refs) for the document compiled in
+        this context, where targets is the sorted list of its section
+        and anchor IDs, and refs that of the IDs its xrefs and links
+        point to.
+        """
 
-        for line in content.splitlines():
-            if line.strip() == "":
-                self.processEmptyLine()
+        return sorted(set(self.linkTargets)), sorted(set(self.linkRefs))
+
+    def dependencies(self):
+        """
+        Return the sorted list of (filename, digest) tuples for all files
+        that the document compiled in this context includes, directly or
+        indirectly, with their absolute path and the digest of the content
+        that got compiled.
+        """
+
+        return sorted(set(self.includes))
+
+    def parserState(self):
+        """
+        Return a copy of the current state of the parsing machine, as a
+        dict. Given to processLines(), parsing continues from there.
+        The opened blocks of the output are not part of the state.
+        """
+
+        return copy.deepcopy(dict([(a, getattr(self, a)) for a in parserStateAttributes]))
+
+    def processLine(self, line):
+        """
+        Parse a single line of the current document.
+        """
+
+        if line.strip() == "":
+            self.processEmptyLine()
+            return
+
+        # Only try the regexes that can match the first character,
+        # plain text lines don't need any of them
+        c = line[0]
+        if self.parseMode == PM_CODE or self.parseMode == PM_CODEPARA:
+            # Only look for closing environments
+            if c == '}' and closeenv.match(line):
+                self.closeLastEnvironment()
             else:
-                if ((self.parseMode != PM_CODE) and
-                    (self.parseMode != PM_CODEPARA)):
-                    varMatch = var.match(line)
-                    envMatch = env.match(line)
-                    listMatch = li.match(line)
-                    headerMatch = header.match(line)
-                else:                    
-                    varMatch = None
-                    envMatch = None
-                    listMatch = None
-                    headerMatch = None
-                # Always look for closing environments
-                closeEnvMatch = closeenv.match(line)
-
-                if varMatch:
-                    # Catch vars
-                    key = varMatch.group(1)
-                    self.vars[key] = varMatch.group(2)
-                elif closeEnvMatch:
-                    # Close last environment
-                    self.closeLastEnvironment()
-                elif envMatch and (envMatch.group(2) in self.envTags):
-                    self.processEnvironment(envMatch)
-                elif listMatch and listMatch.start() == 0:
+                self.processText(line, self.parseMode)
+            return
+
+        if c == '@':
+            varMatch = var.match(line)
+            if varMatch:
+                # Catch vars
+                key = varMatch.group(1)
+                self.vars[key] = varMatch.group(2)
+                return
+        elif c == '}':
+            if closeenv.match(line):
+                # Close last environment
+                self.closeLastEnvironment()
+                return
+        elif c == '{' or (c in envStartChars and ':' in line):
+            envMatch = env.match(line)
+            if (envMatch and envMatch.group(2) == 'Include' and
+                self.processInclude(envMatch)):
+                return
+            if envMatch and (envMatch.group(2) in self.envTags):
+                self.processEnvironment(envMatch)
+                return
+            if c == '{':
+                listMatch = li.match(line)
+                if listMatch:
                     self.processList(listMatch)
-                elif headerMatch and headerMatch.start() == 0:
-                    self.processSection(headerMatch)
-                else:
-                    if self.parseMode == PM_VOID:
-                        # Stack new para environment
-                        self.openEnv('Para')
-                        # Set para as current environment
-                        self.parseMode = PM_PARA
-                    # Continue to collect lines
-                    self.processText(line, self.parseMode)
-                        
-                
+                    return
+        elif c in listStartChars:
+            listMatch = li.match(line)
+            if listMatch:
+                self.processList(listMatch)
+                return
+        elif c == '=':
+            headerMatch = header.match(line)
+            if headerMatch:
+                self.processSection(headerMatch)
+                return
+
+        if self.parseMode == PM_VOID:
+            # Stack new para environment
+            self.openEnv('Para')
+            # Set para as current environment
+            self.parseMode = PM_PARA
+        # Continue to collect lines
+        self.processText(line, self.parseMode)
+
+    def processLines(self, lines, state=None):
+        """
+        Parse the given iterable of text lines, without line endings,
+        and yield the output in chunks as the single blocks get closed.
+        The collected vars (title, author,...) are available in self.vars,
+        they're complete after the last chunk was yielded.
+        This keeps the state of the document in self, so call it
+        for a context from newContext(), when sharing the compiler.
+        Parsing starts from the given parserState() if any, instead
+        of the start of a document.
+        """
+
+        self.initDocument()
+        if state is not None:
+            self.__dict__.update(copy.deepcopy(state))
+        for line in lines:
+            self.processLine(line)
+            if self.result and line.strip() == "":
+                chunk = "".join(self.result)
+                self.result = []
+                yield chunk
+
         # Close all blocks that are still opened
+        self.flushCode()
         self.closeAllOpenedBlocks()
+        if self.result:
+            chunk = "".join(self.result)
+            self.result = []
+            yield chunk
 
-        self.vars["content"] = self.result
+    def process(self, content, source=None) :
+        """
+        Does the main work, by parsing the content as read from
+        the current input file. The document is compiled in a
+        new context, that is kept as lastContext afterwards.
+        The name of the input file source is needed for resolving
+        includes, without it they're relative to the current folder.
+        """
+        
+        ctx = self.newContext()
+        if source is not None:
+            ctx.setSource(source)
+        content = "".join(ctx.processLines(content.splitlines()))
+        ctx.vars["content"] = content
+        self.lastContext = ctx
         
-        return self.vars
+        return ctx.vars
+
+    def render(self, ops):
+        """
+        Render the list of output operations ops, as recorded by
+        an IntermediateCompiler, and return the resulting text.
+        Like process(), this works in a new context.
+        """
+
+        return "".join(self.renderChunks(ops))
+
+    def renderChunks(self, ops):
+        """
+        Render the list of output operations ops like render(), but
+        yield the output in chunks instead of joining it. The context
+        is kept as lastContext, once the last chunk was yielded.
+        """
+
+        ctx = self.newContext()
+        ctx.initDocument()
+        for name, args, kwargs in ops:
+            getattr(ctx, name)(*args, **kwargs)
+            # Pass the output on every few blocks, like processLines()
+            if len(ctx.result) >= 64:
+                chunk = "".join(ctx.result)
+                ctx.result = []
+                yield chunk
+        self.lastContext = ctx
+        if ctx.result:
+            chunk = "".join(ctx.result)
+            ctx.result = []
+            yield chunk
 
     def processEmptyLine(self):
         """
@@ -542,7 +1621,7 @@ class WikiCompiler :
 
         # Line is emtpy: Normal mode or code env?
         if self.parseMode == PM_CODE:
-            self.result += "\n"
+            self.codeLines.append(None)
         elif self.parseMode == PM_CODEPARA or self.parseMode == PM_ENVPARA:
             # Current Code environment gets closed
             self.closeLastEnvironment()
@@ -577,15 +1656,20 @@ class WikiCompiler :
         """
 
         if mode != PM_CODE and mode != PM_CODEPARA:
-            # Replace inline expressions
-            text = self.inlineReplace(text)
+            self.writeText(text)
         else:
-            text = self.replaceBlanks(text)
-            text = self.escapeCodeText(text)
-            text = processVerbatim(text, self.codeType)
- 
-        # Add text to result
-        self.result += "%s\n" % text
+            # Collect code lines, up to the end of the environment
+            self.codeLines.append(text)
+
+    def flushCode(self):
+        """
+        Output the collected lines of the current Code environment,
+        highlighted as a single block.
+        """
+
+        if self.codeLines:
+            self.writeCode(self.codeLines, self.codeType)
+            self.codeLines = []
 
     def processSection(self, headerMatch):
         """
@@ -624,24 +1708,9 @@ class WikiCompiler :
                 self.sectionIndent -= mcnt
 
         # Step 2: Open new section
-        self.openBlocks.append('Section')
         self.sectionIndent += 1
-        if 'SectionTitleChar' in self.envTags:
-            # Handling of section titles that get constructed by prepending
-            # a number of chars to the title, representing the current indentation
-            # depth, e.g. MoinMoin format
-            newtitle = self.envTags['SectionTitleChar'][0]*(self.sectionIndent+1)
-            newtitle += " %s " % sectionTitle
-            newtitle += self.envTags['SectionTitleChar'][1]*(self.sectionIndent+1)
-            sectionTitle = newtitle
-        elif 'SectionTitleUnderlineChars' in self.envTags:
-            # Handling reST style section titles, where the char for the
-            # underline changes with the level of indent
-            linechars = self.envTags['SectionTitleUnderlineChars'][0]
-            tchar = linechars[self.sectionIndent % len(linechars)]
-            sectionTitle += "\n"+len(sectionTitle)*tchar
-        text = "%s\n" % (self.envTags['Section'][0] % {'title':sectionTitle, 'id':sectionId})
-        self.result += self.inlineReplace(text)
+        self.inSection = True
+        self.openSection(sectionTitle, sectionId, self.sectionBase + self.sectionIndent)
 
     def processEnvironment(self, envMatch):
         """
@@ -661,19 +1730,11 @@ class WikiCompiler :
             fighref = self.codeType
             seppos = fighref.find("||")
             if seppos > 0:
-                figatts = ' '+self.applyFilters(fighref[seppos+2:])
-                fighref = fighref[:seppos]
+                self.openFigure(blockType, fighref[:seppos], fighref[seppos+2:])
             else:
-                figatts = ' alt="'+fighref+'"'
-            self.openEnv(blockType, fref=fighref, atts=figatts)
-            if self.envTags[blockType][2]:
-                # Wrap text in para
-                self.openEnv('Para')
+                self.openFigure(blockType, fighref)
         elif blockType != "Code":
-            self.openEnv(blockType)
-            if self.envTags[blockType][2]:
-                # Wrap text in para
-                self.openEnv('Para')
+            self.openBlock(blockType)
         else:
             self.openEnv(blockType)
             if blockStart == "{{":
@@ -682,60 +1743,28 @@ class WikiCompiler :
                 curParseMode = PM_CODEPARA
         self.parseMode = curParseMode
 
-    def replaceLinks(self, text, rex, tkey):
-        """
-        Replace the URL link definitions, as defined by the regular
-        expression rex, in the given text.
-        """
-        
-        lMatch = rex.search(text)
-        while lMatch:
-            href = lMatch.group(1)
-            atxt = lMatch.group(2)
-            urlatts = ""
-            seppos = atxt.find("||")
-            if seppos > 0:
-                urlatts = ' '+atxt[:seppos]
-                atxt = atxt[seppos+2:]
-            middle = self.dictTags[tkey] % {'url' : href,
-                                           'atts' : urlatts,
-                                           'linktext' : atxt}
-            text = (text[:lMatch.start()] + middle + text[lMatch.end():])
-            lMatch = rex.search(text, lMatch.start()+len(middle))
-            
-        return text
-
-    def replaceSimpleLinks(self, text, rex, tkey):
+    def processInclude(self, envMatch):
         """
-        Replace document-internal links, as defined by the regexp
-        rex, in the given text.
+        Include the Wiki file, whose name follows the 'Include:'. Its
+        sections go below the current one. The include ends all open
+        paragraphs, lists and environments, like the end of a section.
+        Returns False if there is no such file, the line is normal
+        text then.
         """
-        
-        lMatch = rex.search(text)
-        while lMatch:
-            href = lMatch.group(1)
-            atxt = href
-            urlatts = ""
-            middle = self.dictTags[tkey] % {'url' : href,
-                                           'atts' : urlatts,
-                                           'linktext' : atxt}
-            text = (text[:lMatch.start()] + middle + text[lMatch.end():])
-            lMatch = rex.search(text, lMatch.start()+len(middle))
-        
-        return text
 
-    def replaceAll(self, text, regex, starttag, endtag):
-        """
-        Replace all occurrences of regex in text, by wrapping them
-        in a starttag/endtag pair of XML tags.
-        """
-        match = regex.search(text)
-        while match:
-            middle = starttag+match.group(1)+endtag
-            text = text[:match.start()]+middle+text[match.end():]
-            match = regex.search(text, match.start()+len(middle))
-            
-        return text
+        filename = includePath(self.sourceDir, envMatch)
+        if not os.path.isfile(filename):
+            return False
+        sectionIndent = self.sectionBase
+        if self.inSection:
+            sectionIndent += self.sectionIndent + 1
+        self.flushCode()
+        self.envStack = []
+        self.modeStack = []
+        self.lastListItem = ""
+        self.parseMode = PM_VOID
+        self.includeFile(filename, sectionIndent)
+        return True
 
     def applyFilters(self, text):
         """
@@ -744,19 +1773,28 @@ class WikiCompiler :
         is filtered out...or not.
         """
         
-        match = filter.search(text)
+        filterTemplates = self.outputFormat.filterTemplates
+        if len(text) > guardLength:
+            search = MarkupGuard(text, 'filter', filter).search
+        else:
+            search = lambda pos: filter.search(text, pos)
+        match = search(0)
+        if not match:
+            return text
+        # A filter can't start within the text before a replaced one,
+        # so the search simply goes on behind each match
+        chunks = []
+        pos = 0
         while match:
             fkey = match.group(1)
-            if fkey in self.filters:
-                text = (text[:match.start()]+
-                        self.filters[fkey] % {'content' : match.group(2)} +
-                        text[match.end():])
-            else:
-                text = (text[:match.start()]+
-                        text[match.end():])
-            match = filter.search(text)
+            chunks.append(text[pos:match.start()])
+            if fkey in filterTemplates:
+                chunks.append(filterTemplates[fkey].fill(match.group(2)))
+            pos = match.end()
+            match = search(pos)
+        chunks.append(text[pos:])
             
-        return text
+        return "".join(chunks)
 
     def replaceBlanks(self, text):
         """
@@ -766,47 +1804,98 @@ class WikiCompiler :
         text = text.replace("\\blank","")
         return text
        
-    def inlineReplace(self, text):
+    def renderInline(self, markup, groups):
         """
-        Apply all inline replacements (like links, images, filters,...)
-        to the given text.
+        Return the output for a single inline markup (like em, link or img),
+        where groups holds the already processed groups of its regexp match.
         """
-        
-        # Apply filters
-        text = self.applyFilters(text)
-        
-        # Find and replace images
-        iMatch = img.search(text)
-        while iMatch:
-            href = iMatch.group(1)
-            urlatts = ""
+
+        if markup in inlineTagKeys:
+            text = groups[0]
+            if markup == 'anchor':
+                if self.idMap:
+                    text = self.idMap.get(text, text)
+                self.linkTargets.append(text)
+            start, end = self.outputFormat.inline[markup]
+            return start+text+end
+        href = groups[0]
+        urlatts = ""
+        if markup == 'img':
             seppos = href.find("||")
             if seppos > 0:
                 urlatts = ' '+href[seppos+2:]
                 href = href[:seppos]
             else:
                 urlatts = ' alt="'+href+'"'
-            text = (text[:iMatch.start()] +
-                    self.dictTags['inlinemediaobject'] % {'fref' : href,
-                                                          'atts' : urlatts} +
-                    text[iMatch.end():])
-                
-            iMatch = img.search(text)
+            return self.outputFormat.image.fill(href, urlatts)
+        if len(groups) > 1:
+            atxt = groups[1]
+            seppos = atxt.find("||")
+            if seppos > 0:
+                urlatts = ' '+atxt[:seppos]
+                atxt = atxt[seppos+2:]
+        else:
+            atxt = href
+        if linkTagKeys[markup] != 'ulink':
+            if self.idMap:
+                href = self.idMap.get(href, href)
+            self.linkRefs.append(href)
+        return self.outputFormat.links[markup].fill(href, urlatts, atxt)
+
+    def inlineScan(self, text, first=0, last=None):
+        """
+        Replace the inline markups inlineMarkups[first:last] in the given
+        text, within a single scan from left to right.
+        The groups of a found markup get the markups of higher precedence
+        applied first, while its output is scanned for the markups of
+        lower precedence only. So, as long as markups don't overlap, the
+        result is the same as when applying all markups one after the
+        other, in the order of inlineMarkups.
+        """
+
+        if last is None:
+            last = len(inlineMarkups)
+        if len(text) > guardLength:
+            search = MarkupGuards(text, first, last).search
+        else:
+            scanner, markupIndex = inlineScanner(first, last)
+            search = lambda pos: inlineMatch(scanner.search(text, pos), markupIndex)
+        found = search(0)
+        if not found:
+            return text
+        chunks = []
+        pos = 0
+        while found:
+            mi, groups, start, end = found
+            markup = inlineMarkups[mi][0]
+            if mi > first:
+                # Apply markups of higher precedence to the groups
+                inner = inlineScanner(first, mi)[0]
+                for i in range(len(groups)):
+                    if len(groups[i]) > guardLength or inner.search(groups[i]):
+                        groups[i] = self.inlineScan(groups[i], first, mi)
+            out = self.renderInline(markup, groups)
+            if mi+1 < last and (len(out) > guardLength or
+                                inlineScanner(mi+1, last)[0].search(out)):
+                # Apply markups of lower precedence to the output
+                out = self.inlineScan(out, mi+1, last)
+            chunks.append(text[pos:start])
+            chunks.append(out)
+            pos = end
+            found = search(pos)
+        chunks.append(text[pos:])
+        return "".join(chunks)
+
+    def inlineReplace(self, text):
+        """
+        Apply all inline replacements (like links, images, filters,...)
+        to the given text.
+        """
         
-        # Find and replace link tags
-        text = self.replaceSimpleLinks(text, urls, 'ulink')
-        text = self.replaceSimpleLinks(text, links, 'link')
-        text = self.replaceLinks(text, url, 'ulink')
-        text = self.replaceLinks(text, xref, 'xref')
-        text = self.replaceLinks(text, link, 'link')
-                        
-        # Apply non-greedy inline substitutions to the joined block
-        text = self.replaceAll(text, em, self.inlineTags["em"][0], self.inlineTags["em"][1])
-        text = self.replaceAll(text, strong, self.inlineTags["strong"][0], self.inlineTags["strong"][1])
-        text = self.replaceAll(text, quote, self.inlineTags["quote"][0], self.inlineTags["quote"][1])
-        text = self.replaceAll(text, code, self.inlineTags["code"][0], self.inlineTags["code"][1])
-        text = self.replaceAll(text, quotedcode, self.inlineTags["quotedcode"][0], self.inlineTags["quotedcode"][1])
-        text = self.replaceAll(text, anchor, self.inlineTags["anchor"][0], self.inlineTags["anchor"][1])
+        # Apply filters
+        text = self.applyFilters(text)
+        # Find and replace images, links and inline markups
+        text = self.inlineScan(text)
         # Replace \blank escape sequences
         text = self.replaceBlanks(text)
         return text
@@ -820,10 +1909,7 @@ class WikiCompiler :
             li = 'ulItem'
         elif li == '#':
             li = 'olItem'
-        self.openEnv(li)
-        if self.envTags[li][2]:
-            # Wrap item in para
-            self.openEnv('Para')
+        self.openBlock(li)
 
     def openTextListItem(self, o, curText):
         """
@@ -860,10 +1946,7 @@ class WikiCompiler :
         Opens a new list environment by pushing
         env onto the stack of opened blocks.
         """
-        self.openEnv(li)
-        if self.envTags[li][2]:
-            # Wrap item in para
-            self.openEnv('Para')
+        self.openBlock(li)
 
     def closeListItem(self, li):
         """
@@ -958,11 +2041,7 @@ class ForrestCompiler(WikiCompiler):
     The WikiCompiler for ApacheForrest XML output.
     """
     
-    def __init__(self):
-        self.envTags = envTagsForrest
-        self.inlineTags = inlineTagsForrest
-        self.dictTags = dictTagsForrest
-        self.filters = filterForrest
+    defaultFormat = formatForrest
 
     def escapeCodeText(self, text):
         """
@@ -979,11 +2058,7 @@ class DocbookCompiler(WikiCompiler):
     The WikiCompiler for Docbook XML output.
     """
 
-    def __init__(self):
-        self.envTags = envTagsDocbook
-        self.inlineTags = inlineTagsDocbook
-        self.dictTags = dictTagsDocbook
-        self.filters = filterDocbook
+    defaultFormat = formatDocbook
 
     def escapeCodeText(self, text):
         """
@@ -1000,22 +2075,14 @@ class MoinCompiler(WikiCompiler):
     The WikiCompiler for MoinMoin Wiki output.
     """
 
-    def __init__(self):
-        self.envTags = envTagsMoin
-        self.inlineTags = inlineTagsMoin
-        self.dictTags = dictTagsMoin
-        self.filters = filterMoin
+    defaultFormat = formatMoin
 
 class RestCompiler(WikiCompiler):
     """
     The WikiCompiler for reST output.
     """
 
-    def __init__(self):
-        self.envTags = envTagsRest
-        self.inlineTags = inlineTagsRest
-        self.dictTags = dictTagsRest
-        self.filters = filterRest
+    defaultFormat = formatRest
 
     def escapeCodeText(self, text):
         """
@@ -1026,8 +2093,531 @@ class RestCompiler(WikiCompiler):
         return text
 
 
+# Output operations of a WikiCompiler, that make up the intermediate form
+intermediateOps = ['openEnv', 'openBlock', 'openFigure', 'openSection',
+                   'closeEnv', 'closeOpenedBlocks', 'closeAllOpenedBlocks',
+                   'writeText', 'writeCode', 'includeFile']
+
+def recordOp(name):
+    """
+    Return a method that records a call of the output operation
+    name, instead of executing it.
+    """
+
+    def record(self, *args, **kwargs):
+        self.ops.append((name, args, kwargs))
+    record.__name__ = name
+    return record
+
+def commonEnvTags(compilers):
+    """
+    Return the sorted names of the environments that all of the
+    given compilers know.
+    """
+
+    names = set(compilers[0].envTags)
+    for c in compilers[1:]:
+        names &= set(c.envTags)
+    return sorted(names)
+
+class IntermediateCompiler(WikiCompiler):
+    """
+    Parses Wiki input into a format-neutral intermediate form, the list
+    of output operations (like openEnv or writeText) with their arguments.
+    This list can then be rendered by the WikiCompiler of each
+    output format, without parsing the input again.
+    """
+
+    def __init__(self, compilers):
+        # Only environments that all formats know can be parsed
+        self.envTags = dict.fromkeys(commonEnvTags(compilers))
+        # Parse with the profile of the compilers
+        if compilers[0].profile is not None:
+            self.enableProfiling(compilers[0].profile)
+
+    def enableProfiling(self, profile=None):
+        """
+        Like WikiCompiler.enableProfiling(), but only the parsing gets
+        timed. The output operations are just recorded here, they're
+        timed where the compilers render them.
+        """
+
+        profile = WikiCompiler.enableProfiling(self, profile)
+        for stage, name in profiledStages:
+            if name in intermediateOps:
+                self.__dict__.pop(name, None)
+        return profile
+
+    def initDocument(self):
+        """
+        Reset the state of the parsing machine and the list of
+        recorded output operations.
+        """
+
+        WikiCompiler.initDocument(self)
+        self.ops = []
+
+    def parse(self, lines):
+        """
+        Parse the given iterable of text lines and return the
+        list of output operations.
+        """
+
+        for chunk in self.processLines(lines):
+            pass
+        return self.ops
+
+for name in intermediateOps:
+    setattr(IntermediateCompiler, name, recordOp(name))
+
+def parseTree(compilers, content, source=None):
+    """
+    Parse the content into a format-neutral document tree, that
+    can be rendered by each of the given compilers. Includes
+    are relative to the folder of the file source.
+    """
+
+    ic = IntermediateCompiler(compilers)
+    if source is not None:
+        ic.setSource(source)
+    return tree.buildTree(ic.parse(content.splitlines()), ic.vars)
+
+# Suffix of the cached document trees, stored next to their source files
+treeCacheSuffix = '.tree'
+
+def loadTree(compilers, content, source, quiet=False):
+    """
+    Return the document tree of the content, read from the Wiki file
+    source, for the given compilers. The tree gets cached in a binary file
+    next to the source and is only parsed again when the source changes,
+    such that changing the skeleton or the output format doesn't require a
+    new parse.
+    """
+
+    key = hashlib.sha1(content.encode('utf8'))
+    key.update(__version__)
+    key.update(",".join(commonEnvTags(compilers)))
+    # Includes are resolved relative to the source, and only
+    # if the included file exists
+    folder = os.path.dirname(source)
+    key.update(folder.encode('utf8'))
+    if 'Include:' in content:
+        for line in content.splitlines():
+            envMatch = 'Include:' in line and env.match(line)
+            if envMatch and envMatch.group(2) == 'Include':
+                key.update(str(os.path.isfile(includePath(folder, envMatch))))
+    key = key.hexdigest()
+    cacheFile = source + treeCacheSuffix
+    try:
+        f = open(cacheFile, 'rb')
+        try:
+            cachedKey, doc = cPickle.load(f)
+        finally:
+            f.close()
+        if cachedKey == key:
+            return doc
+    except Exception:
+        pass
+
+    doc = parseTree(compilers, content, source)
+    try:
+        # Parallel or interrupted builds must not leave a partial file
+        writeChunks(cacheFile, [cPickle.dumps((key, doc), cPickle.HIGHEST_PROTOCOL)])
+    except (IOError, OSError, cPickle.PicklingError), e:
+        if not quiet:
+            print "Warning: couldn't write tree cache %s (%s)" % (cacheFile, e)
+    return doc
+
 compiler_skeletons = {'db' : defaultSkeletonDocbook,
                       'moin' : defaultSkeletonMoin,
                       'rest' : defaultSkeletonRest,
                       'forrest' : defaultSkeletonForrest}
 
+# Slots of a skeleton, and escaped percent signs
+skeletonSlot = re.compile(r"%%|%\((\w+)\)s")
+
+class Skeleton :
+    """ A skeleton text, split once at its %(content)s slot into the
+        templates header and footer, such that the content can be
+        written in between, chunk by chunk. Both are None when the
+        skeleton holds no content slot, or more than one.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.header = None
+        self.footer = None
+        slots = [m for m in skeletonSlot.finditer(text) if m.group(1) == 'content']
+        if len(slots) == 1:
+            self.header = text[:slots[0].start()]
+            self.footer = text[slots[0].end():]
+        # Names of the vars in the header
+        self.headerVars = set()
+        if self.header is not None:
+            self.headerVars = set([m.group(1) for m in skeletonSlot.finditer(self.header)
+                                   if m.group(1)])
+
+    def fill(self, vars):
+        """
+        Return the skeleton with the given vars inserted.
+        """
+
+        return self.text % vars
+
+    def head(self, vars):
+        """
+        Return the header with the given vars inserted. Raises
+        a StaleHeader, when one of them isn't defined (yet).
+        """
+
+        try:
+            return self.header % vars
+        except KeyError, e:
+            raise StaleHeader("var %s of the skeleton isn't defined" % e)
+
+    def foot(self, vars):
+        """
+        Return the footer with the given vars inserted.
+        """
+
+        return self.footer % vars
+
+    def chunks(self, vars, content):
+        """
+        Yield the skeleton with the given vars inserted, where the
+        content is an iterable of text chunks.
+        """
+
+        if self.header is None:
+            vars = dict(vars)
+            vars['content'] = "".join(content)
+            yield self.fill(vars)
+            return
+        yield self.head(vars)
+        for chunk in content:
+            yield chunk
+        yield self.foot(vars)
+
+    def profiled(self, profile):
+        """
+        Return a copy of this Skeleton, that adds the time for
+        inserting the vars to the 'skeleton' stage of the Profile
+        profile. The parsed skeletons stay untouched, since they
+        are shared.
+        """
+
+        skeleton = copy.copy(self)
+        for name in ('fill', 'head', 'foot'):
+            setattr(skeleton, name, profile.timed('skeleton', getattr(skeleton, name)))
+        return skeleton
+
+# Cache of parsed skeletons, see parseSkeleton()
+_skeletons = {}
+
+def parseSkeleton(skeleton):
+    """
+    Return the Skeleton for the given skeleton text.
+    """
+
+    if isinstance(skeleton, Skeleton):
+        return skeleton
+    if skeleton not in _skeletons:
+        _skeletons[skeleton] = Skeleton(skeleton)
+    return _skeletons[skeleton]
+
+class StaleHeader(Exception):
+    """ Raised by streamSkeleton(), when a var that appears in the
+        header of the skeleton got defined after the header was written.
+    """
+    pass
+
+def streamSkeleton(hComp, skeleton, lines, strict=False, source=None):
+    """
+    Compile the given iterable of lines with the WikiCompiler hComp and
+    yield the result, inserted into the skeleton, in chunks.
+    The part of the skeleton before the content gets written as soon as the
+    first output is ready and all of its vars are defined, so vars like title
+    or author should be defined at the start of the document. When one of
+    them changes later, a StaleHeader is raised at the end with strict, else
+    a warning is printed. The lines were read from the file source, if
+    given, see process().
+    """
+
+    skeleton = parseSkeleton(skeleton)
+    if skeleton.header is None:
+        yield skeleton.fill(hComp.process("\n".join(lines), source))
+        return
+    ctx = hComp.newContext()
+    if source is not None:
+        ctx.setSource(source)
+    hComp.lastContext = ctx
+    header = None
+    # Output that waits for the vars of the header
+    held = []
+    for chunk in ctx.processLines(lines):
+        if header is None:
+            if not skeleton.headerVars.issubset(ctx.vars):
+                held.append(chunk)
+                continue
+            header = skeleton.head(ctx.vars)
+            yield header
+            for h in held:
+                yield h
+            held = []
+        yield chunk
+    if header is None:
+        yield skeleton.head(ctx.vars)
+        for h in held:
+            yield h
+    elif header != skeleton.head(ctx.vars):
+        if strict:
+            raise StaleHeader("vars of the skeleton defined too late")
+        print "Warning: vars of the skeleton defined too late, the header is stale"
+    yield skeleton.foot(ctx.vars)
+
+compiler_classes = {'db' : DocbookCompiler,
+                    'moin' : MoinCompiler,
+                    'rest' : RestCompiler,
+                    'forrest' : ForrestCompiler}
+
+def loadFormat(filename):
+    """
+    Load a custom output format from the JSON file filename, and register
+    its compiler and skeleton in compiler_classes and compiler_skeletons.
+    The file holds a dict with the 'name' of the format and optionally:
+    the 'base' format (default: forrest), whose compiler escapes the code
+    and whose tables and skeleton are used where nothing else is given,
+    the tables 'envTags', 'inlineTags', 'dictTags' and 'filters' with
+    the entries that differ from the base (the filters default to one
+    for the name of the format), the 'skeleton' and the 'extension'
+    of the output files. Returns the dict, with name and base set.
+    """
+
+    spec = json.load(open(filename, 'r'))
+    if not isinstance(spec, dict) or not spec.get('name'):
+        raise ValueError("%s: the format needs a name" % filename)
+    name = spec['name']
+    base = spec.setdefault('base', 'forrest')
+    if base not in compiler_classes:
+        raise ValueError("%s: unknown base format '%s'" % (filename, base))
+    baseClass = compiler_classes[base]
+    tables = []
+    for key in ('envTags', 'inlineTags', 'dictTags'):
+        table = dict(getattr(baseClass.defaultFormat, key))
+        table.update(spec.get(key, {}))
+        tables.append(table)
+    filters = {name : '%(content)s'}
+    filters.update(spec.get('filters', {}))
+    try:
+        outputFormat = formats.OutputFormat(name, *(tables + [filters]))
+    except (ValueError, TypeError, KeyError), e:
+        raise ValueError("%s: %s" % (filename, e))
+
+    class CustomCompiler(baseClass):
+        defaultFormat = outputFormat
+    compiler_classes[name] = CustomCompiler
+    compiler_skeletons[name] = spec.get('skeleton', compiler_skeletons[base])
+    return spec
+
+def compileFile(outputs, source, quiet=False, treeCache=False, onlyIfChanged=False):
+    """
+    Compile the Wiki file source and save the results. The list outputs
+    holds a (hComp, skeleton, target) tuple for each output format.
+    The source gets read and parsed only once, even for several formats.
+    With treeCache, the parsed document tree is kept in a file next to
+    the source (see loadTree()). With onlyIfChanged, targets that
+    wouldn't change don't get written (see writeChunks()).
+    The output is streamed to the targets chunk by chunk, together with
+    the parts of the skeleton, so it's never held in memory as a whole.
+    When the first compiler has profiling enabled, reading and writing
+    the files, and parsing and filling the skeleton are timed as well.
+    Afterwards, the dependencies() of each compiler's lastContext
+    list the files that source includes, with their digests.
+    Returns the number of targets that were written.
+    """
+
+    read, parse, write = readUtf8, parseSkeleton, writeChunks
+    profile = outputs[0][0].profile
+    if profile is not None:
+        read = profile.timed('io', readUtf8)
+        parse = profile.timed('skeleton', parseSkeleton)
+        write = profile.timed('io', writeChunks)
+
+    content = read(source, quiet)
+    compilers = [o[0] for o in outputs]
+    ops = None
+    if treeCache:
+        doc = loadTree(compilers, content, source, quiet)
+        ops, docVars = doc.ops(), doc.vars
+    elif len(outputs) > 1:
+        ic = IntermediateCompiler(compilers)
+        ic.setSource(source)
+        ops, docVars = ic.parse(content.splitlines()), ic.vars
+    changed = 0
+    for hComp, skeleton, target in outputs:
+        skeleton = parse(skeleton)
+        if profile is not None:
+            skeleton = skeleton.profiled(profile)
+        if ops is None:
+            try:
+                written = write(target, streamSkeleton(hComp, skeleton, content.splitlines(),
+                                                       True, source), onlyIfChanged)
+            except StaleHeader:
+                # Compile the whole document first
+                written = write(target, [skeleton.fill(hComp.process(content, source))],
+                                onlyIfChanged)
+        else:
+            # Only the output of one format is kept at a time
+            written = write(target, skeleton.chunks(docVars, hComp.renderChunks(ops)),
+                            onlyIfChanged)
+        if written:
+            changed += 1
+    return changed
+
+# Compiler and skeleton of the current thread or process, see compile_many()
+_batch = threading.local()
+
+def initBatch(format, skeleton, hComp=None):
+    """
+    Set the compiler for the given format, that compiles the
+    items of compile_many() in the current thread or process.
+    Threads can share the compiler hComp, processes create their own.
+    """
+
+    if hComp is None:
+        hComp = compiler_classes[format]()
+    _batch.compiler = hComp
+    _batch.skeleton = skeleton
+
+def compileItem(item):
+    """
+    Compile a single (name, text) item of compile_many(), with the
+    compiler of the current thread or process.
+    """
+
+    name, text = item
+    try:
+        return name, _batch.skeleton % _batch.compiler.process(text), None
+    except Exception, e:
+        return name, None, str(e)
+
+def compile_many(items, format='forrest', skeleton=None, pool=None, workers=None,
+                 chunksize=1):
+    """
+    Compile the Wiki texts of an iterable of (name, text) items, and yield
+    a (name, result, error) tuple for each of them, in the same order.
+    The result is the text inserted into the skeleton (the default one
+    for the format, if not given), and error the message of a failed
+    compilation, where result is None. An error doesn't stop the batch.
+
+    By default, all items get compiled one by one in the calling thread,
+    by the same compiler instance. With pool='threads' or
+    pool='processes', a pool of workers (by default, one for each CPU)
+    compiles them in parallel. The threads share a single compiler,
+    while each process creates one of its own.
+    """
+
+    if skeleton is None:
+        skeleton = compiler_skeletons[format]
+    if pool is None:
+        hComp = compiler_classes[format]()
+        for name, text in items:
+            try:
+                result = skeleton % hComp.process(text)
+            except Exception, e:
+                yield name, None, str(e)
+            else:
+                yield name, result, None
+        return
+
+    if pool == 'threads':
+        from multiprocessing.pool import ThreadPool as Pool
+        initArgs = (format, skeleton, compiler_classes[format]())
+    elif pool == 'processes':
+        from multiprocessing import Pool
+        initArgs = (format, skeleton)
+    else:
+        raise ValueError("unknown pool type '%s'" % pool)
+    workerPool = Pool(workers, initBatch, initArgs)
+    try:
+        for result in workerPool.imap(compileItem, items, chunksize):
+            yield result
+        workerPool.close()
+    finally:
+        workerPool.terminate()
+        workerPool.join()
+
+# Compilers and skeletons of the current worker process, see initWorker()
+_worker = None
+
+# Further keyword arguments of compileFile() in the worker processes
+_workerOptions = {}
+
+def initWorker(formats, skeletons, styleFile="style_code.css", treeCache=False,
+               onlyIfChanged=False, includeFolder=None):
+    """
+    Initialize a worker process of a parallel build, by creating
+    its own compiler instances for the given list of formats,
+    with one skeleton each. The workers share the compiled
+    includes through the folder includeFolder.
+    """
+
+    global _worker, _workerOptions
+    highlighter.styleFile = styleFile
+    includeCache.folder = includeFolder
+    _worker = [(compiler_classes[f](), s) for f, s in zip(formats, skeletons)]
+    _workerOptions = {'treeCache' : treeCache,
+                      'onlyIfChanged' : onlyIfChanged}
+
+def captureOutput(func, *args):
+    """
+    Call func with the given arguments, and return the tuple
+    (output, error, result), where output is everything func
+    printed, error is the message of a failed call (or None)
+    and result is the return value of func (or None).
+    """
+
+    import StringIO
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    error = result = None
+    try:
+        try:
+            result = func(*args)
+        except Exception, e:
+            error = str(e)
+        output = sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+    return output, error, result
+
+def captureCompile(outputs, source, quiet=False, treeCache=False, onlyIfChanged=False):
+    """
+    Call compileFile() with the given arguments, and return the tuple
+    (output, error, changed), where output is everything the compiler
+    printed, error is the message of a failed compilation (or None)
+    and changed is the number of targets that were written.
+    """
+
+    output, error, changed = captureOutput(compileFile, outputs, source, quiet,
+                                           treeCache, onlyIfChanged)
+    return output, error, changed or 0
+
+def compileInWorker(job):
+    """
+    Compile a single (source, targets, quiet) job in a worker process,
+    where targets lists the output file for each format.
+    Returns the tuple (output, error, changed, links, includes), where the
+    first three are as for captureCompile(), links is the result of
+    linkInfo() and includes that of dependencies() for the compiled
+    document (both None after an error).
+    """
+
+    source, targets, quiet = job
+    result = captureCompile([(c, s, t) for (c, s), t in zip(_worker, targets)],
+                            source, quiet, **_workerOptions)
+    links = includes = None
+    if result[1] is None:
+        links = _worker[0][0].lastContext.linkInfo()
+        includes = _worker[0][0].lastContext.dependencies()
+    return result + (links, includes)
@@ -0,0 +1,430 @@
+# coding: latin-1
+# Copyright (c) 2009,2010,2011,2012,2013,2014 Dirk Baechle.
+# www: http://bitbucket.org/dirkbaechle/xmlwiko
+# mail: dl9obn AT darc.de
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+"""
+Benchmarks for the xmlwiko compilers.
+
+Run them with
+
+  python -m xmlwiko.bench [options] [formats]
+
+to time each compiler on a synthetic corpus (see xmlwiko.bench.corpus),
+and report lines/sec, MB/sec and the peak memory. The results can be saved
+as JSON and compared with an earlier run.
+
+With the option -t, a stress test compiles many documents in several
+threads at once, sharing one compiler per format, and checks that the
+results match those of a serial run.
+
+With the option -p, generated documents get compiled in parts by several
+processes (see xmlwiko.split), and the results are compared with those
+of a serial compilation.
+
+With the option -a, the compilers run on adversarial inputs of doubling
+size (see xmlwiko.bench.adversarial), and the exit status is 1 when the
+runtime of any case grows quadratically.
+
+With the option -v, documents that define the vars of the skeleton late
+get compiled to files and as a stream, and the results are compared with
+the skeleton filled after compiling the whole document.
+"""
+
+import gc
+import os
+import sys
+import json
+import time
+import platform
+import shutil
+import tempfile
+import StringIO
+import threading
+import multiprocessing
+
+import xmlwiko
+import xmlwiko.split
+from xmlwiko.bench import corpus
+from xmlwiko.bench import adversarial
+
+def peakMemory():
+    """
+    Return the peak resident memory of the current process in kB,
+    or None if it can't be determined on this platform.
+    """
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # Given in bytes instead of kB
+        peak = peak / 1024
+    return peak
+
+def timeCompiler(job):
+    """
+    Compile the content of the (fmt, content, repeat) job with the
+    compiler for the format fmt, repeat times. Returns the best time
+    in seconds and the peak memory of the process.
+    Warnings of the compiler are discarded.
+    """
+
+    fmt, content, repeat = job
+    # Don't leave stylesheets for highlighted code behind
+    xmlwiko.highlighter.styleFile = os.devnull
+    hComp = xmlwiko.compiler_classes[fmt]()
+    skeleton = xmlwiko.compiler_skeletons[fmt]
+    best = None
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    try:
+        for i in range(repeat):
+            gc.collect()
+            start = time.time()
+            skeleton % hComp.process(content)
+            t = time.time() - start
+            if best is None or t < best:
+                best = t
+            sys.stdout.truncate(0)
+    finally:
+        sys.stdout = stdout
+    return best, peakMemory()
+
+def benchmark(content, formats=None, repeat=3):
+    """
+    Time the compilers of the given formats (all of them by default) on
+    the Wiki text content. Each compiler runs in its own process,
+    such that its peak memory can be measured separately. Returns a dict
+    with the results for each format.
+    """
+
+    if formats is None:
+        formats = sorted(xmlwiko.compiler_classes)
+    lines = len(content.splitlines())
+    size = len(content.encode('utf8')) / (1024.0 * 1024.0)
+    results = {}
+    for fmt in formats:
+        pool = multiprocessing.Pool(1)
+        try:
+            seconds, peak = pool.apply(timeCompiler, ((fmt, content, repeat),))
+        finally:
+            pool.close()
+            pool.join()
+        results[fmt] = {'seconds' : seconds,
+                        'lines_per_sec' : lines / seconds,
+                        'mb_per_sec' : size / seconds,
+                        'peak_kb' : peak}
+    return results
+
+def stress(documents=100, lines=200, threads=8, formats=None, seed=0):
+    """
+    Compile the given number of generated documents (each with the
+    given number of lines) in several threads at once, where all threads
+    share the same compiler for each format. Returns the list of
+    (fmt, document) pairs, whose results differ from a serial run
+    with a new compiler for each document.
+    """
+
+    if formats is None:
+        formats = sorted(xmlwiko.compiler_classes)
+    texts = [corpus.generate(lines, seed + i).decode('ascii')
+             for i in range(documents)]
+    xmlwiko.highlighter.styleFile = os.devnull
+    failed = []
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    try:
+        for fmt in formats:
+            skeleton = xmlwiko.compiler_skeletons[fmt]
+            expected = [skeleton % xmlwiko.compiler_classes[fmt]().process(t)
+                        for t in texts]
+            hComp = xmlwiko.compiler_classes[fmt]()
+            results = [None] * documents
+            def worker(offset):
+                for i in range(offset, documents, threads):
+                    results[i] = skeleton % hComp.process(texts[i])
+            workers = [threading.Thread(target=worker, args=(i,))
+                       for i in range(threads)]
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+            for i in range(documents):
+                if results[i] != expected[i]:
+                    failed.append((fmt, i))
+            sys.stdout.truncate(0)
+    finally:
+        sys.stdout = stdout
+    return failed
+
+def splitCheck(documents=10, lines=2000, jobs=2, formats=None, seed=0):
+    """
+    Compile the given number of generated documents (each with the given
+    number of lines) in parts, with jobs parallel processes. Returns
+    the list of (fmt, document) pairs, whose results differ from
+    a serial run.
+    """
+
+    if formats is None:
+        formats = sorted(xmlwiko.compiler_classes)
+    folder = tempfile.mkdtemp(prefix='xmlwiko-bench-')
+    xmlwiko.highlighter.styleFile = os.devnull
+    failed = []
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    try:
+        for i in range(documents):
+            source = os.path.join(folder, "doc%d.wiki" % i)
+            open(source, 'w').write(corpus.generate(lines, seed + i))
+            for fmt in formats:
+                outputs = [(xmlwiko.compiler_classes[fmt](), xmlwiko.compiler_skeletons[fmt],
+                            os.path.join(folder, name)) for name in ('serial', 'split')]
+                xmlwiko.compileFile(outputs[:1], source, True)
+                xmlwiko.split.compileFile(outputs[1:], source, True, jobs,
+                                          styleFile=os.devnull)
+                if open(outputs[0][2], 'rb').read() != open(outputs[1][2], 'rb').read():
+                    failed.append((fmt, i))
+                sys.stdout.truncate(0)
+    finally:
+        sys.stdout = stdout
+        shutil.rmtree(folder, ignore_errors=True)
+    return failed
+
+# Skeleton and documents for varsCheck(), with vars defined after the first block
+lateSkeleton = u'<doc date="%(date)s" title="%(title)s">\n%(content)s\n%(author)s</doc>\n'
+lateDocuments = [u"para one\n\n@date: 2014\n\nmore",
+                 u"@date: 2014\npara one\n\n@title: Late\n\nmore",
+                 u"@date: 2014\n@title: Early\n\npara\n\n@author: Late"]
+
+def varsCheck(formats=None):
+    """
+    Compile the lateDocuments into the lateSkeleton, to a file and as
+    a stream (like stdin to stdout). Returns the list of (fmt, document)
+    pairs, whose results differ from the skeleton filled with the vars
+    of the whole document, without a warning for the stream.
+    """
+
+    if formats is None:
+        formats = sorted(xmlwiko.compiler_classes)
+    folder = tempfile.mkdtemp(prefix='xmlwiko-bench-')
+    xmlwiko.highlighter.styleFile = os.devnull
+    failed = []
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    try:
+        for i, text in enumerate(lateDocuments):
+            source = os.path.join(folder, "doc%d.wiki" % i)
+            target = os.path.join(folder, "doc%d.out" % i)
+            open(source, 'w').write(text.encode('utf8'))
+            for fmt in formats:
+                hComp = xmlwiko.compiler_classes[fmt]()
+                expected = lateSkeleton % hComp.process(text)
+                try:
+                    xmlwiko.compileFile([(hComp, lateSkeleton, target)], source, True)
+                    result = open(target, 'rb').read().decode('utf8')
+                except Exception:
+                    result = None
+                sys.stdout.truncate(0)
+                streamed = "".join(xmlwiko.streamSkeleton(hComp, lateSkeleton,
+                                                          text.splitlines()))
+                warned = "Warning" in sys.stdout.getvalue()
+                if result != expected or (streamed != expected and not warned):
+                    failed.append((fmt, i))
+                sys.stdout.truncate(0)
+    finally:
+        sys.stdout = stdout
+        shutil.rmtree(folder, ignore_errors=True)
+    return failed
+
+def run(lines=10000, seed=0, mix=None, inline=0.3, formats=None, repeat=3):
+    """
+    Generate a synthetic corpus with the given parameters (see
+    xmlwiko.bench.corpus.CorpusGenerator) and benchmark the compilers
+    on it. Returns a dict, that can be saved as JSON.
+    """
+
+    content = corpus.generate(lines, seed, mix, inline).decode('ascii')
+    return {'xmlwiko' : xmlwiko.__version__,
+            'python' : platform.python_version(),
+            'platform' : platform.platform(),
+            'date' : time.strftime("%Y-%m-%d %H:%M:%S"),
+            'corpus' : {'lines' : len(content.splitlines()),
+                        'bytes' : len(content),
+                        'seed' : seed,
+                        'mix' : mix or corpus.defaultMix,
+                        'inline' : inline},
+            'repeat' : repeat,
+            'results' : benchmark(content, formats, repeat)}
+
+def report(data, baseline=None):
+    """
+    Print the results of a run, compared to the results
+    of an earlier run baseline if given.
+    """
+
+    c = data['corpus']
+    print "xmlwiko %s, Python %s, %d lines, %d bytes" % (data['xmlwiko'], data['python'],
+                                                         c['lines'], c['bytes'])
+    print "%-8s %10s %12s %8s %10s" % ("format", "seconds", "lines/sec", "MB/sec", "peak kB"),
+    if baseline:
+        print " %8s" % "speedup",
+    print
+    for fmt in sorted(data['results']):
+        r = data['results'][fmt]
+        print "%-8s %10.3f %12.0f %8.2f %10s" % (fmt, r['seconds'], r['lines_per_sec'],
+                                                 r['mb_per_sec'], r['peak_kb']),
+        if baseline:
+            old = baseline['results'].get(fmt)
+            if old:
+                print " %7.2fx" % (old['seconds'] / r['seconds']),
+        print
+
+def usage():
+    print """Usage:
+
+  python -m xmlwiko.bench [options] [formats]
+
+Times the compilers for the given formats (default: all) on a synthetic
+corpus.
+
+Available options:
+
+  -n LINES  - Number of lines in the corpus (default: 10000)
+  -r N      - Number of runs per compiler, the best one counts (default: 3)
+  -s SEED   - Seed of the corpus generator (default: 0)
+  -i SHARE  - Share of words with inline markup (default: 0.3)
+  -m MIX    - Weights of the block types, like 'para=8,list=3,code=0',
+              see xmlwiko.bench.corpus.defaultMix
+  -o FILE   - Save the results as JSON to FILE
+  -c FILE   - Compare with the JSON results of an earlier run in FILE
+  -w FILE   - Write the corpus to FILE, without running the benchmark
+  -t N      - Instead of the benchmark, run the stress test with N threads
+  -d DOCS   - Number of documents with 200 lines each, for the stress
+              test (default: 100)
+  -p N      - Instead of the benchmark, compile -d DOCS documents (default:
+              10) with 2000 lines each in parts, with N processes, and
+              compare the results with a serial run
+  -a        - Instead of the benchmark, check the growth of the runtime
+              on adversarial inputs, starting with -n repetitions of
+              their pattern (default: 8000)
+  -v        - Instead of the benchmark, check documents that define the
+              vars of the skeleton late
+"""
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    lines = 10000
+    size = 8000
+    repeat = 3
+    seed = 0
+    inline = 0.3
+    mix = None
+    output = None
+    compare = None
+    corpusFile = None
+    threads = 0
+    processes = 0
+    documents = None
+    checkGrowth = False
+    checkVars = False
+    formats = []
+    try:
+        while args:
+            a = args.pop(0)
+            if a in ('-h', '-?', '--help'):
+                usage()
+                return 0
+            elif a == '-n':
+                lines = int(args.pop(0))
+                size = lines
+            elif a == '-r':
+                repeat = int(args.pop(0))
+            elif a == '-s':
+                seed = int(args.pop(0))
+            elif a == '-i':
+                inline = float(args.pop(0))
+            elif a == '-m':
+                mix = {}
+                for m in args.pop(0).split(','):
+                    key, weight = m.split('=')
+                    if key not in corpus.defaultMix:
+                        raise ValueError("unknown block type '%s'" % key)
+                    mix[key] = float(weight)
+            elif a == '-o':
+                output = args.pop(0)
+            elif a == '-c':
+                compare = args.pop(0)
+            elif a == '-w':
+                corpusFile = args.pop(0)
+            elif a == '-t':
+                threads = int(args.pop(0))
+            elif a == '-p':
+                processes = int(args.pop(0))
+            elif a == '-d':
+                documents = int(args.pop(0))
+            elif a == '-a':
+                checkGrowth = True
+            elif a == '-v':
+                checkVars = True
+            elif a in xmlwiko.compiler_classes:
+                formats.append(a)
+            else:
+                raise ValueError("unknown option '%s'" % a)
+    except (IndexError, ValueError), e:
+        print "Error: %s" % (e or "missing argument")
+        return 1
+
+    if corpusFile:
+        open(corpusFile, 'w').write(corpus.generate(lines, seed, mix, inline))
+        return 0
+
+    if checkGrowth:
+        results = adversarial.check(size, 3, formats or None, repeat)
+        return adversarial.report(results) and 1
+
+    if checkVars:
+        failed = varsCheck(formats or None)
+        for fmt, i in failed:
+            print "%s: document %d differs from the filled skeleton" % (fmt, i)
+        print "%d documents with late vars: %d failed" % (len(lateDocuments), len(failed))
+        return len(failed) and 1
+
+    if processes:
+        failed = splitCheck(documents or 10, 2000, processes, formats or None, seed)
+        for fmt, i in failed:
+            print "%s: document %d differs from the serial result" % (fmt, i)
+        print "%d processes, %d documents: %d failed" % (processes, documents or 10, len(failed))
+        return len(failed) and 1
+
+    if threads:
+        documents = documents or 100
+        failed = stress(documents, 200, threads, formats or None, seed)
+        for fmt, i in failed:
+            print "%s: document %d differs from the serial result" % (fmt, i)
+        print "%d threads, %d documents: %d failed" % (threads, documents, len(failed))
+        return len(failed) and 1
+
+    data = run(lines, seed, mix, inline, formats or None, repeat)
+    baseline = None
+    if compare:
+        baseline = json.load(open(compare))
+    report(data, baseline)
+    if output:
+        json.dump(data, open(output, 'w'), indent=1, sort_keys=True)
+    return 0
@@ -0,0 +1,9 @@
+# coding: latin-1
+"""
+Entry point for 'python -m xmlwiko.bench'.
+"""
+
+import sys
+from xmlwiko.bench import main
+
+sys.exit(main())
@@ -0,0 +1,125 @@
+# coding: latin-1
+# Copyright (c) 2009,2010,2011,2012,2013,2014 Dirk Baechle.
+# www: http://bitbucket.org/dirkbaechle/xmlwiko
+# mail: dl9obn AT darc.de
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+"""
+Adversarial inputs for the xmlwiko compilers.
+
+Each case creates a document of a given size, like a single long line full
+of unclosed markers. The compile time gets measured while the size doubles,
+and a case fails when the time grows clearly faster than the size, as it
+does for an algorithm with quadratic runtime.
+"""
+
+import gc
+import os
+import sys
+import time
+import StringIO
+
+import xmlwiko
+
+# Document generators, for a size n
+cases = {'filters' : lambda n: "x " + "**docbook y** " * n,
+         'unknown-filters' : lambda n: "x " + "**zz y** " * n,
+         'filter-lines' : lambda n: "x **docbook y** **zz w**\n" * n,
+         'filter-keys' : lambda n: "x " + "**a " * n,
+         'stars' : lambda n: "x " + "**" * n,
+         'stars-blank' : lambda n: "x " + "**" * n + " y",
+         'strong' : lambda n: "x " + "!!a " * n,
+         'code' : lambda n: "x " + "$$a " * n,
+         'quote' : lambda n: "x " + "''a " * n,
+         'em' : lambda n: "x " + "\\\\a " * n,
+         'anchor' : lambda n: "x " + "@@a " * n,
+         'images' : lambda n: "x " + "<<" * n,
+         'images-open' : lambda n: "x " + "<<a> " * n,
+         'urls' : lambda n: "x " + "[[a " * n,
+         'urls-run' : lambda n: "x " + "[[" * n,
+         'links' : lambda n: "x " + "((a " * n,
+         'xrefs' : lambda n: "x " + "&&a " * n,
+         'xrefs-run' : lambda n: "x " + "&&" * n,
+         'closed-run' : lambda n: "x <<a>> [[b c]] " + "<<[[((" * n,
+         'url-keys' : lambda n: "[[x" * n + " a]b ]]",
+         'link-keys' : lambda n: "((x" * n + " a)b ))",
+         'xref-keys' : lambda n: "&&x" * n + " a&b &&",
+         'filter-texts' : lambda n: "**x" * n + " a*b **",
+         'url-texts' : lambda n: "[[x " * n + "a]b ]]",
+         'plain' : lambda n: "x " + "word " * n}
+
+def timeCase(fmt, text, repeat=3):
+    """
+    Return the best time in seconds for compiling the text
+    with the compiler for the format fmt.
+    """
+
+    hComp = xmlwiko.compiler_classes[fmt]()
+    best = None
+    for i in range(repeat):
+        gc.collect()
+        start = time.time()
+        hComp.process(text)
+        t = time.time() - start
+        if best is None or t < best:
+            best = t
+    return best
+
+def check(size=8000, steps=3, formats=None, repeat=3):
+    """
+    Compile each case with the given size, doubling it steps-1 times.
+    Returns a list with a (case, fmt, times, growth) tuple for each case
+    and format, where growth is the average factor between the times for
+    two subsequent sizes. For a linear runtime it's about 2.0, for a
+    quadratic one about 4.0. Times below a millisecond count as one.
+    """
+
+    if formats is None:
+        formats = sorted(xmlwiko.compiler_classes)
+    # Don't leave stylesheets for highlighted code behind
+    xmlwiko.highlighter.styleFile = os.devnull
+    results = []
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    try:
+        for name in sorted(cases):
+            for fmt in formats:
+                times = []
+                for step in range(steps):
+                    times.append(timeCase(fmt, cases[name](size << step).decode('ascii'),
+                                          repeat))
+                    sys.stdout.truncate(0)
+                growth = (max(times[-1], 1e-3) / max(times[0], 1e-3)) ** (1.0 / (steps - 1))
+                results.append((name, fmt, times, growth))
+    finally:
+        sys.stdout = stdout
+    return results
+
+def report(results, limit=3.0):
+    """
+    Print the results of check(), and return the number of
+    cases whose growth exceeds the limit.
+    """
+
+    failed = 0
+    print "%-16s %-8s %s %8s" % ("case", "format", "seconds".center(28), "growth")
+    for name, fmt, times, growth in results:
+        status = ""
+        if growth > limit:
+            status = "  FAILED"
+            failed += 1
+        print "%-16s %-8s %s %8.2f%s" % (name, fmt, " ".join(["%8.4f" % t for t in times]),
+                                         growth, status)
+    print "%d of %d cases grow faster than %.1fx per doubled size" % (failed, len(results), limit)
+    return failed
@@ -0,0 +1,160 @@
+# coding: latin-1
+# Copyright (c) 2009,2010,2011,2012,2013,2014 Dirk Baechle.
+# www: http://bitbucket.org/dirkbaechle/xmlwiko
+# mail: dl9obn AT darc.de
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+"""
+Generator for synthetic Wiki documents, as input for the benchmarks.
+"""
+
+import random
+
+# Default weights of the block types in a generated document
+defaultMix = {'para' : 8,
+              'section' : 1,
+              'list' : 3,
+              'code' : 1,
+              'figure' : 1,
+              'env' : 1}
+
+words = ("alpha beta gamma delta epsilon zeta eta theta iota kappa lambda "
+         "omicron sigma omega xmlwiko forrest docbook skeleton").split()
+
+class CorpusGenerator:
+    """ Creates random, but reproducible, Wiki documents with the given
+        mix of block types (a dict with a weight for each key of
+        defaultMix) and a share of inline markups between 0.0 and 1.0.
+    """
+
+    def __init__(self, seed=0, mix=None, inline=0.3):
+        self.random = random.Random(seed)
+        self.mix = dict(defaultMix)
+        if mix:
+            self.mix.update(mix)
+        self.inline = inline
+        self.blocks = sorted(self.mix)
+
+    def word(self):
+        return self.random.choice(words)
+
+    def markup(self):
+        """
+        Return a single inline markup, link or anchor.
+        """
+
+        w = self.word()
+        return self.random.choice(["\\\\%s\\\\" % w,
+                                   "!!%s!!" % w,
+                                   "''%s''" % w,
+                                   "$$%s$$" % w,
+                                   "%%%%%s%%%%" % w,
+                                   "@@%s@@" % w,
+                                   "[[http://www.%s.org %s site]]" % (w, w),
+                                   "[[http://www.%s.org]]" % w,
+                                   "((%s.html %s page))" % (w, w),
+                                   "((%s.html))" % w,
+                                   "&&%s see %s&&" % (w, w),
+                                   "<<%s.png>>" % w,
+                                   "**docbook %s**" % w])
+
+    def line(self):
+        """
+        Return a line of text, with inline markups.
+        """
+
+        r = self.random
+        return " ".join([r.random() < self.inline and self.markup() or self.word()
+                         for i in range(r.randint(4, 14))])
+
+    def para(self, out):
+        for i in range(self.random.randint(1, 6)):
+            out.append(self.line())
+
+    def section(self, out):
+        level = self.random.choice(["", "", "+", "-", "--"])
+        out.append("==%s %s %s == sec%d" % (level, self.word().capitalize(),
+                                            self.word(), len(out)))
+
+    def list(self, out):
+        r = self.random
+        kind = r.choice("#*~")
+        if kind == '~':
+            for i in range(r.randint(2, 6)):
+                out.append("~%s||%s" % (self.word(), self.line()))
+            return
+        depth = ""
+        for i in range(r.randint(2, 10)):
+            if depth and r.random() < 0.3:
+                depth = depth[:-1]
+            elif len(depth) < 3 and r.random() < 0.4 or not depth:
+                depth += r.choice("#*")
+            out.append(depth + " " + self.line())
+            if r.random() < 0.2:
+                out.append(self.line())
+
+    def code(self, out):
+        r = self.random
+        nested = r.random() < 0.3
+        out.append("%sCode: %s" % (nested and "{{" or "", r.choice(["", "", "python"])))
+        for i in range(r.randint(2, 12)):
+            out.append("%sif a < b and c & d: %s(%d)" % (" " * 4 * r.randint(0, 2),
+                                                       self.word(), i))
+            if nested and r.random() < 0.1:
+                out.append("")
+        if nested:
+            out.append("}}")
+
+    def figure(self, out):
+        out.append("%s: %s.png" % (self.random.choice(["Figure", "Image"]), self.word()))
+        out.append(self.line())
+
+    def env(self, out):
+        r = self.random
+        tag = r.choice(["Note", "Warning", "Abstract", "Remark", "TODO", "Important"])
+        if r.random() < 0.3:
+            out.append("{{%s:" % tag)
+            self.para(out)
+            out.append("")
+            self.para(out)
+            out.append("}}")
+        else:
+            out.append("%s:" % tag)
+            self.para(out)
+
+    def document(self, lines):
+        """
+        Return a document with (about) the given number of lines.
+        """
+
+        r = self.random
+        total = float(sum([self.mix[b] for b in self.blocks]))
+        out = ["@title: Benchmark %s" % self.word(), "@author: xmlwiko bench", ""]
+        while len(out) < lines:
+            x = r.random() * total
+            for b in self.blocks:
+                x -= self.mix[b]
+                if x < 0:
+                    break
+            getattr(self, b)(out)
+            out.append("")
+        return "\n".join(out) + "\n"
+
+def generate(lines, seed=0, mix=None, inline=0.3):
+    """
+    Return a synthetic Wiki document with (about) the given number
+    of lines, see CorpusGenerator.
+    """
+
+    return CorpusGenerator(seed, mix, inline).document(lines)
@@ -0,0 +1,256 @@
+# coding: latin-1
+# Copyright (c) 2009,2010,2011,2012,2013,2014 Dirk Baechle.
+# www: http://bitbucket.org/dirkbaechle/xmlwiko
+# mail: dl9obn AT darc.de
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+"""
+Docbook books, assembled from one Wiki file per chapter.
+
+The chapters get compiled by the DocbookCompiler, in parallel worker
+processes if wanted, each into a temporary part file. The parts are then
+copied into the book skeleton one after the other, wrapped into a
+<chapter> each, so the book is never held in memory as a whole.
+
+Section and anchor IDs have to be unique within the book. When a chapter
+defines an ID that an earlier chapter (or the ID of a chapter) already
+uses, the chapter gets compiled again with the ID renamed to
+'chapterid.id', including the xrefs and links of the chapter itself.
+"""
+
+import os
+import re
+import sys
+import shutil
+import tempfile
+
+import xmlwiko
+
+defaultSkeleton = u"""<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE book PUBLIC "-//OASIS//DTD DocBook XML V4.2//EN"
+"http://www.oasis-open.org/docbook/xml/4.1.2/docbookx.dtd">
+<book>
+  <title>%(title)s</title>
+  <bookinfo>
+    <author>
+      <surname>%(author)s</surname>
+    </author>
+  </bookinfo>
+%(content)s
+</book>
+"""
+
+# Start and end of each chapter in the book
+chapterStart = u'<chapter id="%(id)s"><title>%(title)s</title>\n'
+chapterEnd = u'</chapter>\n'
+
+# Chars that can't appear in a chapter ID
+idChars = re.compile(r"[^\w.-]+")
+
+def readOrder(filename):
+    """
+    Read the chapter order file filename. It lists the Wiki file of one
+    chapter per line, relative to the folder of the order file, and may
+    define vars like '@title: ...' for the book skeleton. Empty lines and
+    lines starting with '#' are ignored.
+    Returns the tuple (chapters, vars).
+    """
+
+    folder = os.path.dirname(filename)
+    chapters = []
+    vars = {'title' : '', 'author' : ''}
+    for line in xmlwiko.readUtf8(filename, True).splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        varMatch = xmlwiko.var.match(line)
+        if varMatch:
+            vars[varMatch.group(1)] = varMatch.group(2)
+        else:
+            chapters.append(os.path.join(folder, line))
+    return chapters, vars
+
+def chapterIds(chapters):
+    """
+    Return a unique ID for each of the given chapter files,
+    derived from its path without the extension.
+    """
+
+    ids = []
+    for source in chapters:
+        name = os.path.splitext(os.path.normpath(source))[0]
+        cid = idChars.sub('_', name.replace(os.sep, '.')).strip('._').lower() or 'chapter'
+        unique = cid
+        cnt = 1
+        while unique in ids:
+            cnt += 1
+            unique = "%s_%d" % (cid, cnt)
+        ids.append(unique)
+    return ids
+
+# The compiler of the current process, see compileChapter()
+_compiler = None
+
+def initChapterWorker(styleFile="style_code.css", includeFolder=None):
+    """
+    Initialize a worker process, that compiles chapters.
+    """
+
+    xmlwiko.highlighter.styleFile = styleFile
+    xmlwiko.includeCache.folder = includeFolder
+
+def processChapter(source, part, idMap, quiet):
+    """
+    Stream the output for the chapter source into the file part.
+    The dict idMap holds the new names of IDs, or is None.
+    Returns the tuple (vars, links) with the dict of the chapter's vars
+    and the result of its linkInfo().
+    """
+
+    global _compiler
+    if _compiler is None:
+        _compiler = xmlwiko.DocbookCompiler()
+    ctx = _compiler.newContext()
+    ctx.setSource(source)
+    ctx.idMap = idMap
+    content = xmlwiko.readUtf8(source, quiet)
+    xmlwiko.writeChunks(part, ctx.processLines(content.splitlines()))
+    return ctx.vars, ctx.linkInfo()
+
+def compileChapter(job):
+    """
+    Compile a single (source, part, idMap, quiet) job with processChapter().
+    Returns the tuple (output, error, vars, links), where output is
+    everything the compiler printed, error the message of a failed
+    compilation (or None), vars the dict of the chapter's vars and
+    links the result of its linkInfo().
+    """
+
+    output, error, result = xmlwiko.captureOutput(processChapter, *job)
+    vars, links = result or (None, None)
+    return output, error, vars, links
+
+def compileChapters(jobs, numJobs=1, styleFile="style_code.css"):
+    """
+    Run compileChapter() for each of the given jobs, with numJobs
+    parallel processes. Returns the list of results, in the same order.
+    """
+
+    if numJobs < 2 or len(jobs) < 2:
+        return [compileChapter(job) for job in jobs]
+    import multiprocessing
+    pool = multiprocessing.Pool(numJobs, initChapterWorker,
+                                (styleFile, xmlwiko.includeCache.folder))
+    # Start the largest chapters first, to keep the pool balanced
+    order = sorted(range(len(jobs)), key=lambda i: -os.path.getsize(jobs[i][0]))
+    results = {}
+    for i in order:
+        results[i] = pool.apply_async(compileChapter, (jobs[i],))
+    pool.close()
+    results = [results[i].get() for i in range(len(jobs))]
+    pool.join()
+    return results
+
+def renameIds(ids, links):
+    """
+    Return a dict with the new IDs for each chapter, or None for a chapter
+    that can keep its IDs, where ids lists the chapter IDs and links the
+    (targets, refs) of each chapter. An ID keeps its name in the first
+    chapter that defines it.
+    """
+
+    taken = set(ids)
+    for targets, refs in links:
+        taken.update(targets)
+    used = set(ids)
+    result = []
+    for cid, (targets, refs) in zip(ids, links):
+        idMap = {}
+        for t in targets:
+            if t in used:
+                new = "%s.%s" % (cid, t)
+                cnt = 1
+                while new in taken:
+                    cnt += 1
+                    new = "%s.%s_%d" % (cid, t, cnt)
+                taken.add(new)
+                idMap[t] = new
+        used.update(targets)
+        result.append(idMap or None)
+    return result
+
+def bookChunks(skeleton, vars, ids, parts, chapterVars):
+    """
+    Yield the book in chunks: the skeleton, filled with the vars,
+    and one chapter for each of the part files in between.
+    """
+
+    skeleton = xmlwiko.parseSkeleton(skeleton)
+    if skeleton.header is None:
+        raise ValueError("the book skeleton needs a single '%(content)s'")
+    yield skeleton.head(vars)
+    for cid, part, cvars in zip(ids, parts, chapterVars):
+        yield chapterStart % {'id' : cid, 'title' : cvars['title'] or cid}
+        for block in xmlwiko.copyChunks(part):
+            yield block
+        yield chapterEnd
+    yield skeleton.foot(vars)
+
+def assemble(chapters, target, skeleton=defaultSkeleton, vars=None, numJobs=1,
+             quiet=False, styleFile="style_code.css"):
+    """
+    Compile the list of chapter files, with numJobs parallel processes,
+    and write them as one Docbook book to the file target. The skeleton
+    gets filled with the dict vars (title, author,...).
+    Returns the list of (source, message) tuples for the chapters
+    that couldn't be compiled. The book is only written without errors.
+    """
+
+    if vars is None:
+        vars = {'title' : '', 'author' : ''}
+    ids = chapterIds(chapters)
+    folder = tempfile.mkdtemp(prefix='xmlwiko-book-')
+    try:
+        parts = [os.path.join(folder, "%d.part" % i) for i in range(len(chapters))]
+        jobs = [(source, part, None, quiet) for source, part in zip(chapters, parts)]
+        results = compileChapters(jobs, numJobs, styleFile)
+        errors = []
+        for source, (output, error, cvars, links) in zip(chapters, results):
+            sys.stdout.write(output)
+            if error is not None:
+                errors.append((source, error))
+        if errors:
+            return errors
+
+        # Compile the chapters with duplicate IDs again
+        idMaps = renameIds(ids, [r[3] for r in results])
+        again = [i for i, idMap in enumerate(idMaps) if idMap]
+        if again:
+            if not quiet:
+                for i in again:
+                    print "Renaming %d duplicate IDs in %s" % (len(idMaps[i]), chapters[i])
+            renamed = compileChapters([(chapters[i], parts[i], idMaps[i], True) for i in again],
+                                      numJobs, styleFile)
+            for i, result in zip(again, renamed):
+                sys.stdout.write(result[0])
+                if result[1] is not None:
+                    errors.append((chapters[i], result[1]))
+            if errors:
+                return errors
+
+        xmlwiko.writeChunks(target, bookChunks(skeleton, vars, ids, parts,
+                                               [r[2] for r in results]))
+        return []
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
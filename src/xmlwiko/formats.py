@@ -0,0 +1,155 @@
+# coding: latin-1
+# Copyright (c) 2009,2010,2011,2012,2013,2014 Dirk Baechle.
+# www: http://bitbucket.org/dirkbaechle/xmlwiko
+# mail: dl9obn AT darc.de
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+"""
+Precompiled output formats.
+
+The tag tables of an output format (envTags, inlineTags, dictTags and
+filters, see xmlwiko.envTagsForrest for an example) are compiled once into
+an OutputFormat. It holds the ready-made strings for opening and closing
+each environment, and the templates for links, images and filters
+with their placeholders already resolved, such that a WikiCompiler
+doesn't have to look them up and format them again for every tag.
+"""
+
+import re
+import operator
+
+# Keys into the dictTags of a format, for the different link markups
+linkTagKeys = {'urls' : 'ulink',
+               'links' : 'link',
+               'url' : 'ulink',
+               'xref' : 'xref',
+               'link' : 'link'}
+
+# Placeholders in the templates of a format
+placeholder = re.compile(r"%\((\w+)\)s|%%")
+
+class ReadOnly(object):
+    """ Base class of the precompiled parts of a format, whose
+        attributes can't be changed after they were set up.
+    """
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%s.%s is read-only" % (self.__class__.__name__, name))
+
+    def setup(self, **values):
+        """
+        Set the initial values of the attributes.
+        """
+
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+class Template(ReadOnly):
+    """ A template text with named placeholders like %(url)s, compiled
+        for the fixed list of parameter names params. Its fill() method
+        takes the values as positional arguments in the same order,
+        instead of a dict.
+    """
+    __slots__ = ('text', 'format', 'pick')
+
+    def __init__(self, text, params):
+        keys = []
+        def positional(match):
+            if match.group(1) is None:
+                return '%%'
+            if match.group(1) not in params:
+                raise ValueError("unknown placeholder '%s' in the template '%s'" %
+                                 (match.group(0), text))
+            keys.append(params.index(match.group(1)))
+            return '%s'
+        format = placeholder.sub(positional, text)
+        if keys == range(len(params)):
+            # Arguments can be passed on as they are
+            pick = None
+        elif len(keys) > 1:
+            pick = operator.itemgetter(*keys)
+        elif keys:
+            # A single itemgetter would return the value, not a tuple
+            pick = lambda args, index=keys[0]: (args[index],)
+        else:
+            pick = lambda args: ()
+        self.setup(text=text, format=format, pick=pick)
+
+    def fill(self, *args):
+        """
+        Return the template text with the placeholders replaced
+        by the given values, in the order of the params.
+        """
+
+        if self.pick is None:
+            return self.format % args
+        return self.format % self.pick(args)
+
+class EnvTag(ReadOnly):
+    """ The compiled entry of an environment in the envTags of a format.
+        The end string close already includes the newline, when the
+        environment adds one on closing, while closeLine always ends
+        with a newline.
+    """
+    __slots__ = ('start', 'end', 'wrapInPara', 'close', 'closeLine')
+
+    def __init__(self, entry):
+        start, end, wrapInPara, newline = entry
+        close = end
+        if newline:
+            close += "\n"
+        self.setup(start=start, end=end, wrapInPara=bool(wrapInPara),
+                   close=close, closeLine=end + "\n")
+
+class OutputFormat(ReadOnly):
+    """ An output format, compiled from its tag tables. The original
+        tables are kept as envTags, inlineTags, dictTags and filters.
+    """
+    __slots__ = ('name', 'envTags', 'inlineTags', 'dictTags', 'filters',
+                 'envs', 'inline', 'links', 'image', 'section', 'filterTemplates',
+                 'titleChars', 'underlineChars')
+
+    def __init__(self, name, envTags, inlineTags, dictTags, filters):
+        for tag in ('Section', 'Para'):
+            if tag not in envTags:
+                raise ValueError("format '%s' has no environment '%s'" % (name, tag))
+        envs = {}
+        for tag, entry in envTags.items():
+            if len(entry) != 4:
+                raise ValueError("environment '%s' of format '%s' needs 4 fields" % (tag, name))
+            envs[tag] = EnvTag(entry)
+        inline = {}
+        for markup, entry in inlineTags.items():
+            inline[markup] = (entry[0], entry[1])
+        links = {}
+        for markup, key in linkTagKeys.items():
+            links[markup] = Template(dictTags[key], ('url', 'atts', 'linktext'))
+        titleChars = None
+        if 'SectionTitleChar' in envTags:
+            titleChars = tuple(envTags['SectionTitleChar'][:2])
+        underlineChars = None
+        if 'SectionTitleUnderlineChars' in envTags:
+            underlineChars = envTags['SectionTitleUnderlineChars'][0]
+        filterTemplates = {}
+        for key, text in filters.items():
+            filterTemplates[key] = Template(text, ('content',))
+        self.setup(name=name,
+                   envTags=envTags, inlineTags=inlineTags,
+                   dictTags=dictTags, filters=filters,
+                   envs=envs, inline=inline, links=links,
+                   image=Template(dictTags['inlinemediaobject'], ('fref', 'atts')),
+                   section=Template(envTags['Section'][0], ('title', 'id')),
+                   filterTemplates=filterTemplates,
+                   titleChars=titleChars, underlineChars=underlineChars)
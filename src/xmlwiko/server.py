@@ -0,0 +1,156 @@
+# coding: latin-1
+# Copyright (c) 2009,2010,2011,2012,2013,2014 Dirk Baechle.
+# www: http://bitbucket.org/dirkbaechle/xmlwiko
+# mail: dl9obn AT darc.de
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+"""
+Compile server, that keeps the compilers and skeletons loaded between
+the calls of a build, like one 'xmlwiko db foo.wiki foo.xml' per file.
+
+The server listens on a local Unix socket. Each connection carries a
+single request, a line with a JSON object like
+
+  {"cwd": "/home/doc", "formats": ["db"], "skeletons": ["skeleton.xml"],
+   "source": "foo.wiki", "targets": ["foo.xml"], "quiet": false,
+   "styleFile": "style_code.css", "treeCache": false, "onlyIfChanged": false}
+
+and gets answered with a line {"output": "...", "error": null, "changed": 1},
+holding the messages of the compiler, the error of a failed compilation
+and the number of targets that were written.
+Requests are handled one after the other.
+"""
+
+import os
+import sys
+import json
+import signal
+import socket
+import StringIO
+import SocketServer
+
+import xmlwiko
+
+class CompileHandler(SocketServer.StreamRequestHandler):
+    """ Handles a single compile request.
+    """
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            # Just a check whether the server is running
+            return
+        try:
+            request = json.loads(line)
+            output, error, changed = self.server.compile(request)
+        except Exception, e:
+            output, error, changed = "", "bad request (%s)" % e, 0
+        self.wfile.write(json.dumps({'output' : output,
+                                     'error' : error,
+                                     'changed' : changed}) + "\n")
+
+class CompileServer(SocketServer.UnixStreamServer):
+    """ Unix socket server, that keeps one compiler instance per
+        output format and caches the skeleton files until they change.
+    """
+
+    def __init__(self, socketPath):
+        SocketServer.UnixStreamServer.__init__(self, socketPath, CompileHandler)
+        self.compilers = {}
+        # (mtime, content) of each skeleton file, by format and full path
+        self.skeletons = {}
+
+    def skeleton(self, fmt, filename, quiet):
+        """
+        Return the skeleton for the format fmt, read from the
+        file filename unless it didn't change since the last call.
+        """
+
+        path = os.path.abspath(filename)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            mtime = None
+        cached = self.skeletons.get((fmt, path))
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, xmlwiko.loadOrDefault(filename, xmlwiko.compiler_skeletons[fmt], quiet))
+            self.skeletons[(fmt, path)] = cached
+        return cached[1]
+
+    def compile(self, request):
+        """
+        Compile the given request and return the tuple (output, error,
+        changed), as xmlwiko.captureCompile() does.
+        """
+
+        os.chdir(request['cwd'])
+        styleFile = os.path.abspath(request['styleFile'])
+        if xmlwiko.highlighter.styleFile != styleFile or not os.path.exists(styleFile):
+            # Write the stylesheet again, for this folder
+            xmlwiko.highlighter.styleFile = styleFile
+            xmlwiko.highlighter.styleWritten = False
+        quiet = request['quiet']
+        outputs = []
+        stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+        try:
+            for fmt, filename, target in zip(request['formats'], request['skeletons'],
+                                             request['targets']):
+                if fmt not in self.compilers:
+                    self.compilers[fmt] = xmlwiko.compiler_classes[fmt]()
+                outputs.append((self.compilers[fmt], self.skeleton(fmt, filename, quiet),
+                                target))
+            messages = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        output, error, changed = xmlwiko.captureCompile(outputs, request['source'], quiet,
+                                                        request['treeCache'],
+                                                        request.get('onlyIfChanged', False))
+        return messages + output, error, changed
+
+def serve(socketPath, quiet=False):
+    """
+    Run a compile server on the Unix socket socketPath, until it gets
+    stopped by Ctrl+C or SIGTERM. A stale socket file, left over by a server
+    that didn't stop cleanly, gets removed.
+    """
+
+    if os.path.exists(socketPath):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            try:
+                s.connect(socketPath)
+            except socket.error:
+                os.remove(socketPath)
+            else:
+                raise Exception("a server is already running on %s" % socketPath)
+        finally:
+            s.close()
+
+    server = CompileServer(socketPath)
+    # Remove the socket file when getting terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # Import pygments now, not with the first request that needs it
+    xmlwiko.highlighter.importPygments()
+    if not quiet:
+        print "Serving on %s" % socketPath
+        sys.stdout.flush()
+    try:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    finally:
+        server.server_close()
+        os.remove(socketPath)
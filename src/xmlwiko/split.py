@@ -0,0 +1,230 @@
+# coding: latin-1
+# Copyright (c) 2009,2010,2011,2012,2013,2014 Dirk Baechle.
+# www: http://bitbucket.org/dirkbaechle/xmlwiko
+# mail: dl9obn AT darc.de
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+"""
+Parallel compilation of a single large Wiki file.
+
+A BoundaryScanner runs the parsing machine over the whole document once,
+but without creating any output, it only keeps track of the opened blocks.
+Before each section header that closes all opened blocks, i.e. a section
+at the top level outside of any environment or list, it records the state
+of the parser. The document can be split in front of these headers: each
+part gets compiled in a worker process, starting from the recorded state,
+and ends by closing all its blocks, which is exactly what the following
+header writes in a serial run. So the joined parts are byte-identical to
+the output of a serial compilation.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+
+import xmlwiko
+
+class BoundaryScanner(xmlwiko.WikiCompiler):
+    """ Finds the section headers of a document, where it can be split.
+        The output operations only track the stack of opened blocks,
+        for the OutputFormat of the given compiler.
+    """
+
+    def __init__(self, hComp):
+        xmlwiko.WikiCompiler.__init__(self, hComp.outputFormat)
+
+    def openEnv(self, tag, **kwargs):
+        self.openBlocks.append(tag)
+
+    def openFigure(self, tag, href, atts=None):
+        self.openBlock(tag)
+
+    def openSection(self, sectionTitle, sectionId, sectionIndent):
+        self.openBlocks.append('Section')
+
+    def closeEnv(self, tag, **kwargs):
+        if xmlwiko.tos(self.openBlocks) == tag:
+            self.openBlocks.pop()
+
+    def closeOpenedBlocks(self, tag, num=1):
+        cnt = 0
+        while len(self.openBlocks):
+            if self.openBlocks.pop() == tag:
+                cnt += 1
+            if cnt == num:
+                break
+
+    def closeAllOpenedBlocks(self):
+        self.openBlocks = []
+
+    def writeText(self, text):
+        pass
+
+    def writeCode(self, lines, codeType):
+        pass
+
+    def includeFile(self, filename, sectionIndent):
+        while len(self.openBlocks) and xmlwiko.tos(self.openBlocks) != 'Section':
+            self.openBlocks.pop()
+
+    def scan(self, lines):
+        """
+        Parse the list of lines and return the list of (index, state)
+        tuples for the lines where the document can be split, with
+        the parserState() in front of the line.
+        """
+
+        self.initDocument()
+        points = []
+        for i, line in enumerate(lines):
+            if (line[:2] == '==' and self.parseMode != xmlwiko.PM_CODE and
+                self.parseMode != xmlwiko.PM_CODEPARA and not self.codeLines and
+                xmlwiko.header.match(line)):
+                state = self.parserState()
+                self.processLine(line)
+                if self.openBlocks == ['Section'] and i > 0:
+                    points.append((i, state))
+            else:
+                self.processLine(line)
+        return points
+
+def chooseParts(lines, points, numParts):
+    """
+    Return the list of (start, end, state) tuples for splitting the lines
+    into at most numParts parts of about the same size, at the split
+    points found by BoundaryScanner.scan(). The first part has no state.
+    """
+
+    total = sum([len(l) + 1 for l in lines])
+    parts = []
+    start = 0
+    state = None
+    size = 0
+    pos = 0
+    for index, pstate in points:
+        while pos < index:
+            size += len(lines[pos]) + 1
+            pos += 1
+        if size >= total * (len(parts) + 1) / numParts and len(parts) < numParts - 1:
+            parts.append((start, index, state))
+            start, state = index, pstate
+    parts.append((start, len(lines), state))
+    return parts
+
+# Compilers of the current process, by format
+_compilers = {}
+
+def initPartWorker(styleFile="style_code.css", includeFolder=None):
+    """
+    Initialize a worker process, that compiles parts of a document.
+    """
+
+    xmlwiko.highlighter.styleFile = styleFile
+    xmlwiko.includeCache.folder = includeFolder
+
+def processPart(fmt, source, text, state, part):
+    """
+    Stream the output of the compiler for the format fmt into the file
+    part, where text holds the lines of a part of the Wiki file source,
+    that starts with the parser state state.
+    Returns the dict of vars at the end of the part.
+    """
+
+    if fmt not in _compilers:
+        _compilers[fmt] = xmlwiko.compiler_classes[fmt]()
+    ctx = _compilers[fmt].newContext()
+    ctx.setSource(source)
+    xmlwiko.writeChunks(part, ctx.processLines(text.splitlines(), state))
+    return ctx.vars
+
+def compilePart(job):
+    """
+    Compile a single (fmt, source, text, state, part) job with processPart().
+    Returns the tuple (output, error, vars), where output is everything
+    the compiler printed, error the message of a failed compilation
+    (or None) and vars the dict of vars at the end of the part.
+    """
+
+    return xmlwiko.captureOutput(processPart, *job)
+
+def joinParts(skeleton, vars, parts):
+    """
+    Yield the content of the part files in chunks, inserted
+    into the skeleton.
+    """
+
+    skeleton = xmlwiko.parseSkeleton(skeleton)
+    if skeleton.header is None:
+        vars = dict(vars)
+        vars['content'] = "".join([open(p, 'rb').read() for p in parts]).decode('utf8')
+        yield skeleton.fill(vars)
+        return
+    yield skeleton.head(vars)
+    for part in parts:
+        for block in xmlwiko.copyChunks(part):
+            yield block
+    yield skeleton.foot(vars)
+
+def compileFile(outputs, source, quiet=False, numJobs=2, onlyIfChanged=False,
+                styleFile="style_code.css"):
+    """
+    Compile the Wiki file source like xmlwiko.compileFile(), but split it
+    into parts at its top level sections, that get compiled by numJobs
+    parallel processes. The list outputs holds a (hComp, skeleton, target)
+    tuple for each output format, where the compiler hComp has to be
+    registered in xmlwiko.compiler_classes under the name of its format.
+    Returns the number of targets that were written.
+    """
+
+    content = xmlwiko.readUtf8(source, quiet)
+    lines = content.splitlines()
+    content = None
+    folder = tempfile.mkdtemp(prefix='xmlwiko-split-')
+    pool = None
+    changed = 0
+    try:
+        for hComp, skeleton, target in outputs:
+            fmt = hComp.outputFormat.name
+            scanner = BoundaryScanner(hComp)
+            scanner.setSource(source)
+            parts = chooseParts(lines, scanner.scan(lines), numJobs * 2)
+            if len(parts) < 2:
+                changed += xmlwiko.compileFile([(hComp, skeleton, target)], source, True,
+                                               onlyIfChanged=onlyIfChanged)
+                continue
+            if pool is None:
+                import multiprocessing
+                pool = multiprocessing.Pool(numJobs, initPartWorker,
+                                            (styleFile, xmlwiko.includeCache.folder))
+            partFiles = [os.path.join(folder, "%s.%d.part" % (fmt, i)) for i in range(len(parts))]
+            results = [pool.apply_async(compilePart, ((fmt, source, "\n".join(lines[start:end]),
+                                                       state, partFile),))
+                       for (start, end, state), partFile in zip(parts, partFiles)]
+            results = [r.get() for r in results]
+            for output, error, vars in results:
+                sys.stdout.write(output)
+                if error is not None:
+                    raise Exception(error)
+            if not quiet:
+                print "Compiled %d parts of %s" % (len(parts), source)
+            if xmlwiko.writeChunks(target, joinParts(skeleton, results[-1][2], partFiles),
+                                   onlyIfChanged):
+                changed += 1
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        shutil.rmtree(folder, ignore_errors=True)
+    return changed
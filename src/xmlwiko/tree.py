@@ -0,0 +1,252 @@
+# coding: latin-1
+# Copyright (c) 2009,2010,2011,2012,2013,2014 Dirk Baechle.
+# www: http://bitbucket.org/dirkbaechle/xmlwiko
+# mail: dl9obn AT darc.de
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+"""
+Document tree of a parsed Wiki file.
+
+The tree gets built from the output operations that an IntermediateCompiler
+records (see xmlwiko.intermediateOps). Container nodes (sections, paras,
+environments, lists and list items) correspond to the opened blocks, text
+lines and code blocks are the leaves. Flattening the tree with ops() gives
+the original list of operations back, so it can be rendered by any
+WikiCompiler.
+"""
+
+# Block tags of lists and list items
+listTags = ['#', '*', '~']
+listItemTags = ['olItem', 'ulItem', 'vlEntry', 'dtItem', 'ddItem']
+
+class Node(object):
+    """ Base class of all container nodes. The close attribute holds the
+        operation that closed this node (and maybe several of its
+        descendants), or None if it got closed by one of its ancestors.
+    """
+    __slots__ = ('children', 'close')
+
+    def __init__(self):
+        self.children = []
+        self.close = None
+
+    def openOp(self):
+        """
+        Return the operation that opens this node.
+        """
+        return None
+
+    def ops(self, result=None):
+        """
+        Append the output operations for this node and
+        all its descendants to the list result.
+        """
+
+        if result is None:
+            result = []
+        op = self.openOp()
+        if op is not None:
+            result.append(op)
+        for c in self.children:
+            c.ops(result)
+        if self.close is not None:
+            result.append(self.close)
+        return result
+
+class Document(Node):
+    """ The root of a parsed Wiki file, holding its vars (title, author,...).
+    """
+    __slots__ = ('vars',)
+
+    def __init__(self, vars):
+        Node.__init__(self)
+        self.vars = vars
+
+class Section(Node):
+    """ A section with its title, id and indent level.
+    """
+    __slots__ = ('title', 'id', 'indent')
+    tag = 'Section'
+
+    def __init__(self, title, id, indent):
+        Node.__init__(self)
+        self.title = title
+        self.id = id
+        self.indent = indent
+
+    def openOp(self):
+        return ('openSection', (self.title, self.id, self.indent), {})
+
+class Para(Node):
+    """ A paragraph of text.
+    """
+    __slots__ = ()
+    tag = 'Para'
+
+    def openOp(self):
+        return ('openEnv', ('Para',), {})
+
+class Environment(Node):
+    """ An environment like Code, Note or Abstract. Environments that
+        were opened as blocks (wrapped) may get a para wrapped
+        around their text, depending on the output format.
+    """
+    __slots__ = ('tag', 'wrapped', 'atts')
+
+    def __init__(self, tag, wrapped, atts):
+        Node.__init__(self)
+        self.tag = tag
+        self.wrapped = wrapped
+        self.atts = atts
+
+    def openOp(self):
+        if self.wrapped:
+            return ('openBlock', (self.tag,), self.atts)
+        return ('openEnv', (self.tag,), self.atts)
+
+class Figure(Node):
+    """ A Figure or Image environment, for the image href with
+        the optional attributes atts.
+    """
+    __slots__ = ('tag', 'href', 'atts')
+
+    def __init__(self, tag, href, atts=None):
+        Node.__init__(self)
+        self.tag = tag
+        self.href = href
+        self.atts = atts
+
+    def openOp(self):
+        return ('openFigure', (self.tag, self.href, self.atts), {})
+
+class List(Node):
+    """ An ordered (#), unordered (*) or variable list (~).
+    """
+    __slots__ = ('tag',)
+
+    def __init__(self, tag):
+        Node.__init__(self)
+        self.tag = tag
+
+    def openOp(self):
+        return ('openBlock', (self.tag,), {})
+
+class ListItem(List):
+    """ A single item of a list, or the term/description of a
+        variable list entry.
+    """
+    __slots__ = ()
+
+class Leaf(object):
+    """ Base class of all leaf nodes.
+    """
+    __slots__ = ()
+
+    def ops(self, result):
+        result.append(self.op())
+        return result
+
+class Text(Leaf):
+    """ A run of text with inline markups, still in Wiki syntax.
+    """
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+    def op(self):
+        return ('writeText', (self.text,), {})
+
+class Code(Leaf):
+    """ The lines of a Code environment, where empty lines are None.
+    """
+    __slots__ = ('lines', 'codeType')
+
+    def __init__(self, lines, codeType):
+        self.lines = lines
+        self.codeType = codeType
+
+    def op(self):
+        return ('writeCode', (self.lines, self.codeType), {})
+
+class Op(Leaf):
+    """ Any other operation, like a closeEnv that didn't match
+        the currently opened block.
+    """
+    __slots__ = ('name', 'args', 'kwargs')
+
+    def __init__(self, name, args, kwargs):
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+
+    def op(self):
+        return (self.name, self.args, self.kwargs)
+
+def openNode(name, args, kwargs):
+    """
+    Return the container node for the open operation name.
+    """
+
+    if name == 'openSection':
+        return Section(*args)
+    if name == 'openFigure':
+        return Figure(*args)
+    tag = args[0]
+    if name == 'openEnv' and tag == 'Para' and not kwargs:
+        return Para()
+    if name == 'openBlock' and not kwargs:
+        if tag in listTags:
+            return List(tag)
+        if tag in listItemTags:
+            return ListItem(tag)
+    return Environment(tag, name == 'openBlock', kwargs)
+
+def buildTree(ops, vars):
+    """
+    Build the document tree for the list of output operations ops,
+    with the given dict of vars.
+    """
+
+    doc = Document(vars)
+    stack = [doc]
+    for op in ops:
+        name, args, kwargs = op
+        if name.startswith('open'):
+            node = openNode(name, args, kwargs)
+            stack[-1].children.append(node)
+            stack.append(node)
+        elif name == 'closeEnv' and len(stack) > 1 and stack[-1].tag == args[0]:
+            stack.pop().close = op
+        elif name == 'closeOpenedBlocks' and len(stack) > 1:
+            tag = args[0]
+            num = (args[1:] or [kwargs.get('num', 1)])[0]
+            cnt = 0
+            while len(stack) > 1:
+                node = stack.pop()
+                if node.tag == tag:
+                    cnt += 1
+                if cnt == num:
+                    break
+            node.close = op
+        elif name == 'closeAllOpenedBlocks' and len(stack) > 1:
+            stack[1].close = op
+            del stack[1:]
+        elif name == 'writeText':
+            stack[-1].children.append(Text(*args))
+        elif name == 'writeCode':
+            stack[-1].children.append(Code(*args))
+        else:
+            stack[-1].children.append(Op(name, args, kwargs))
+    return doc